@@ -0,0 +1,265 @@
+"""
+Headless batch rendering and mesh export for every series under a directory tree.
+
+    python batch.py /archive /exports --workers 8 --isovalues 300 700 --formats stl vtp
+
+Each series folder gets ray-cast and MPR mid-slice snapshots plus one mesh per
+isovalue and format, mirrored under the output directory with a manifest.json. A
+rerun skips series whose manifest matches their current files and, unless
+--retry-failed is given, series listed in failures.json. Folders without DICOM
+images are skipped. Volumes and meshes are only kept in the viewer's
+on-disk caches with --disk-cache.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+# Workers never open a window
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import vtk  # noqa: E402
+
+from series_loader import NoImagesError, list_series_files  # noqa: E402
+from volume_cache import fingerprint  # noqa: E402
+
+
+MESH_WRITERS = {
+    "stl": vtk.vtkSTLWriter,
+    "vtp": vtk.vtkXMLPolyDataWriter,
+}
+
+
+def find_series_folders(root):
+    # Every folder that directly holds files is a candidate series; loading one without
+    # DICOM images raises NoImagesError before anything is rendered
+    folders = []
+    for folder, _, files in os.walk(root):
+        if files:
+            folders.append(folder)
+    return sorted(folders)
+
+
+def write_snapshot(renderer, path, size):
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(*size)
+    window.AddRenderer(renderer)
+    window.Render()
+
+    capture = vtk.vtkWindowToImageFilter()
+    capture.SetInput(window)
+    capture.ReadFrontBufferOff()
+    capture.Update()
+
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(path)
+    writer.SetInputConnection(capture.GetOutputPort())
+    writer.Write()
+    window.Finalize()
+
+
+def process_series(folder, out_dir, options):
+    """
+    Renders and exports one series; runs in a worker process.
+
+    Returns:
+        A manifest dict describing what was written.
+    """
+    # Imported here so the parent process stays light and never touches Qt or the caches
+    from isosurface import isosurface_service
+    from main import Visualizer
+    from volume_cache import load_volume, volume_cache
+
+    # A batch run over an archive would otherwise fill the user's disk caches
+    if not options.get("disk_cache"):
+        volume_cache.loader = functools.partial(load_volume, store=None)
+        isosurface_service.store = None
+
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = []
+    try:
+        visualizer = Visualizer(folder, "raycast", isovalue=options["isovalues"][0] if options["isovalues"] else 500)
+        dims = visualizer.image_data.GetDimensions()
+
+        if options["raycast"]:
+            path = os.path.join(out_dir, "raycast.png")
+            write_snapshot(visualizer.render(), path, options["size"])
+            outputs.append(path)
+
+        if options["mpr"]:
+            for view in visualizer.get_mpr_viewers():
+                view.set_window_level(*options["window_level"])
+                path = os.path.join(out_dir, f"{view.orientation}.png")
+                view.render(*options["size"]).save(path)
+                outputs.append(path)
+
+        for isovalue in options["isovalues"]:
+            surface = isosurface_service.get(visualizer.series_key, visualizer.image_data, isovalue, options["smoothing"])
+            for fmt in options["formats"]:
+                path = os.path.join(out_dir, f"surface_{isovalue:g}.{fmt}")
+                writer = MESH_WRITERS[fmt]()
+                writer.SetFileName(path)
+                writer.SetInputData(surface)
+                writer.Write()
+                outputs.append(path)
+    finally:
+        # One worker handles many series; keep only the current one in memory
+        volume_cache.clear()
+        isosurface_service.cache.clear()
+
+    return {
+        "folder": folder,
+        "fingerprint": visualizer.series_key[1],
+        "dimensions": list(dims),
+        "bytes": int(visualizer.image_data.GetActualMemorySize()) * 1024,
+        "outputs": [os.path.relpath(path, out_dir) for path in outputs],
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _run_task(folder, out_dir, options):
+    manifest = process_series(folder, out_dir, options)
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def is_done(folder, out_dir):
+    # A manifest is written last, so its presence with a matching fingerprint means the series is complete
+    try:
+        with open(os.path.join(out_dir, "manifest.json")) as f:
+            manifest = json.load(f)
+        return manifest["fingerprint"] == fingerprint(list_series_files(folder))
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load_failures(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def run_batch(root, output, workers, options, retry_failed=False, log=print):
+    """
+    Processes every series under root on a pool of worker processes.
+
+    Returns:
+        The run summary, also written to output/summary.json.
+    """
+    failures_path = os.path.join(output, "failures.json")
+    failures = load_failures(failures_path)
+    os.makedirs(output, exist_ok=True)
+
+    pending, skipped = [], 0
+    for folder in find_series_folders(root):
+        out_dir = os.path.join(output, os.path.relpath(folder, root))
+        if is_done(folder, out_dir) or (folder in failures and not retry_failed):
+            skipped += 1
+        else:
+            pending.append((folder, out_dir))
+    log(f"{len(pending)} series to process, {skipped} already done or failed before")
+
+    start = time.perf_counter()
+    done, crashed, failed, not_series = [], [], [], []
+
+    def finish(folder, future):
+        try:
+            manifest = future.result()
+        except BrokenProcessPool:
+            return False
+        except NoImagesError:
+            # READMEs, notes and DICOMDIR-only folders are not series, so they are not failures
+            failures.pop(folder, None)
+            not_series.append(folder)
+            return True
+        except Exception as error:
+            failures[folder] = f"{type(error).__name__}: {error}"
+            failed.append(folder)
+            log(f"FAILED {folder}: {failures[folder]}")
+            return True
+        failures.pop(folder, None)
+        done.append(manifest)
+        log(f"ok {folder} ({manifest['seconds']:.1f} s)")
+        return True
+
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        futures = {executor.submit(_run_task, folder, out_dir, options): (folder, out_dir) for folder, out_dir in pending}
+        for future in as_completed(futures):
+            if not finish(futures[future][0], future):
+                crashed.append(futures[future])
+
+    # A worker dying (e.g. inside a GL driver) breaks the whole pool; rerun the series it took down
+    # one at a time so only the culprit is marked failed
+    for folder, out_dir in crashed:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+            if not finish(folder, executor.submit(_run_task, folder, out_dir, options)):
+                failures[folder] = "worker process crashed"
+                failed.append(folder)
+                log(f"FAILED {folder}: {failures[folder]}")
+
+    with open(failures_path, "w") as f:
+        json.dump(failures, f, indent=2)
+    if not_series:
+        log(f"{len(not_series)} folders without DICOM images skipped")
+
+    total_bytes = sum(manifest["bytes"] for manifest in done)
+    total_slices = sum(manifest["dimensions"][2] for manifest in done)
+    elapsed = time.perf_counter() - start
+    summary = {
+        "processed": len(done),
+        "skipped": skipped + len(not_series),
+        "failed": len(failed),
+        "workers": workers,
+        "seconds": elapsed,
+        "series_per_minute": len(done) / elapsed * 60 if elapsed else 0.0,
+        "slices_per_second": total_slices / elapsed if elapsed else 0.0,
+        "megabytes_per_second": total_bytes / 2**20 / elapsed if elapsed else 0.0,
+    }
+    with open(os.path.join(output, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Directory tree holding the series")
+    parser.add_argument("output", help="Directory receiving the snapshots and meshes")
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument("--isovalues", type=float, nargs="*", default=[300.0])
+    parser.add_argument("--formats", nargs="*", choices=sorted(MESH_WRITERS), default=["stl"])
+    parser.add_argument("--smoothing", type=float, nargs=2, default=(0, 0.1), metavar=("ITERATIONS", "PASS_BAND"))
+    parser.add_argument("--size", type=int, nargs=2, default=(512, 512), metavar=("W", "H"))
+    parser.add_argument("--window-level", type=float, nargs=2, default=(400, 40), metavar=("WINDOW", "LEVEL"))
+    parser.add_argument("--no-raycast", action="store_true", help="Skip the ray-cast snapshot")
+    parser.add_argument("--no-mpr", action="store_true", help="Skip the MPR mid-slice snapshots")
+    parser.add_argument("--retry-failed", action="store_true", help="Process series that failed in earlier runs")
+    parser.add_argument("--disk-cache", action="store_true", help="Keep volumes and meshes in the viewer's on-disk caches")
+    args = parser.parse_args(argv)
+
+    options = {
+        "isovalues": args.isovalues,
+        "formats": args.formats,
+        "smoothing": (int(args.smoothing[0]), args.smoothing[1]),
+        "size": tuple(args.size),
+        "window_level": tuple(args.window_level),
+        "raycast": not args.no_raycast,
+        "mpr": not args.no_mpr,
+        "disk_cache": args.disk_cache,
+    }
+    summary = run_batch(args.root, args.output, args.workers, options, args.retry_failed)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
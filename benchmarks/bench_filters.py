@@ -0,0 +1,88 @@
+"""
+Times the slab filter engine against the in-process VTK filters and checks that both
+produce the same voxels.
+
+    python benchmarks/bench_filters.py --shape 300 512 512 --processes 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import vtk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parallel_filters import SlabFilterEngine, make_filter  # noqa: E402
+from series_loader import SeriesVolume, image_to_array, to_vtk_image  # noqa: E402
+
+
+# Slices filtered once per engine to start its worker processes before timing
+WARMUP_SLICES = 16
+
+
+def synthetic_volume(shape, seed=0):
+    # CT-like int16 volume: a soft tissue ellipsoid with a denser core, plus noise
+    rng = np.random.default_rng(seed)
+    z, y, x = np.ogrid[-1:1:shape[0] * 1j, -1:1:shape[1] * 1j, -1:1:shape[2] * 1j]
+    radius = x ** 2 + y ** 2 + z ** 2
+    volume = np.where(radius < 0.8, 40.0, -1000.0) + np.where(radius < 0.2, 900.0, 0.0)
+    volume += rng.normal(0, 30, shape)
+    return volume.astype(np.int16)
+
+
+def vtk_reference(image_data, name, parameter):
+    image_filter = make_filter(name, parameter)
+    image_filter.SetInputData(image_data)
+    image_filter.Update()
+    return image_to_array(image_filter.GetOutput())
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=(200, 256, 256), metavar=("Z", "Y", "X"))
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--median", type=int, nargs="+", default=[3, 5])
+    parser.add_argument("--sigma", type=float, nargs="+", default=[1.0, 2.0])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    array = synthetic_volume(tuple(args.shape))
+    image_data = to_vtk_image(SeriesVolume(array, (1.0, 1.0, 1.0), (0.0, 0.0, 0.0), (1, 0, 0, 0, 1, 0, 0, 0, 1), "bench"))
+    stages = [("denoise", k) for k in args.median] + [("smooth", s) for s in args.sigma]
+
+    results = []
+    for name, parameter in stages:
+        baseline, reference = timed(lambda: vtk_reference(image_data, name, parameter), args.repeat)
+        row = {"stage": name, "parameter": parameter, "vtk_seconds": baseline, "engine": []}
+        print(f"{name} {parameter}: VTK in-process {baseline:.3f} s")
+        for processes in sorted(set(args.processes)):
+            engine = SlabFilterEngine(processes)
+            engine.run(array[:WARMUP_SLICES], name, parameter)
+            seconds, output = timed(lambda: engine.run(array, name, parameter), args.repeat)
+            identical = bool(np.array_equal(output, reference))
+            engine.shutdown()
+            row["engine"].append({"processes": processes, "seconds": seconds, "identical": identical})
+            print(f"  {processes:3d} processes {seconds:.3f} s  x{baseline / seconds:.2f}  identical={identical}")
+        results.append(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"shape": list(args.shape), "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Headless benchmark suite: generates a synthetic CT series and times every stage of the viewer.
+
+    python benchmarks/run_benchmarks.py --shape 200 512 512 --output results.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --output results.json
+
+Rendering runs offscreen; when no OpenGL context can be created at all (e.g. no GPU
+and no OSMesa) the stages that need one are reported as skipped. Each stage reports
+seconds, or per-step milliseconds for interactive stages. With --compare, stages more
+than --threshold times slower than the baseline are listed and the exit code is 1.
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Headless Qt, and caches in a scratch directory so runs neither hit nor pollute the user's
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+SCRATCH = tempfile.mkdtemp(prefix="dicom-viewer-bench-")
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+os.environ.setdefault("DICOM_VIEWER_CACHE_DIR", os.path.join(SCRATCH, "cache"))
+
+import numpy as np  # noqa: E402
+import vtk  # noqa: E402
+from PyQt5.QtGui import QPixmap  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from isosurface import IsosurfaceService  # noqa: E402
+from mesh_store import MeshStore  # noqa: E402
+from main import Visualizer  # noqa: E402
+from filter_chain import FilterChain  # noqa: E402
+from series_loader import load_series, to_vtk_image  # noqa: E402
+from synthetic_series import write_series  # noqa: E402
+from volume_cache import fingerprint, read_dicom_folder  # noqa: E402
+from volume_store import VolumeStore  # noqa: E402
+from volume_mapper import DEFAULT_INTERACTIVE_FPS  # noqa: E402
+import main as viewer  # noqa: E402
+
+
+PROBE = """
+import vtk
+window = vtk.vtkRenderWindow()
+window.SetOffScreenRendering(1)
+window.AddRenderer(vtk.vtkRenderer())
+window.Render()
+"""
+
+
+def render_available():
+    # A broken GL setup can abort the process, so probe it in a child first
+    try:
+        return subprocess.run([sys.executable, "-c", PROBE], capture_output=True, timeout=60).returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def seconds(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def step_stats(samples):
+    samples_ms = np.asarray(samples) * 1000.0
+    return {
+        "steps": len(samples_ms),
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "max_ms": float(samples_ms.max()),
+    }
+
+
+def bench_load(folder, files):
+    results = {}
+    results["pydicom_threads_s"], volume = seconds(lambda: load_series(folder))
+    results["pydicom_processes_s"], _ = seconds(lambda: load_series(folder, use_processes=True))
+    results["vtk_reader_s"], _ = seconds(lambda: read_dicom_folder(folder))
+
+    store = VolumeStore(os.path.join(SCRATCH, "store"))
+    key = fingerprint(files)
+    results["store_save_s"], _ = seconds(lambda: store.save(folder, key, volume))
+    results["store_load_s"], _ = seconds(lambda: store.load(folder, key))
+    return volume, results
+
+
+def offscreen_window(size):
+    window = vtk.vtkRenderWindow()
+    window.SetOffScreenRendering(1)
+    window.SetSize(*size)
+    return window
+
+
+def bench_raycast(image_data, size, mode="gpu"):
+    visualizer = Visualizer(None, "raycast", image_data=image_data, render_mode=mode)
+    window = offscreen_window(size)
+
+    def first_frame():
+        window.AddRenderer(visualizer.render())
+        window.Render()
+
+    first, _ = seconds(first_frame)
+    camera = window.GetRenderers().GetFirstRenderer().GetActiveCamera()
+
+    # Orbit the way the interactor does: interactive quality at its desired update rate
+    visualizer.set_interactive(True)
+    window.SetDesiredUpdateRate(DEFAULT_INTERACTIVE_FPS)
+    frames = []
+    for _ in range(10):
+        camera.Azimuth(5)
+        frames.append(seconds(window.Render)[0])
+    visualizer.set_interactive(False)
+    window.SetDesiredUpdateRate(0.0001)
+    still, _ = seconds(window.Render)
+    return {"first_frame_s": first, "orbit": step_stats(frames), "still_frame_s": still}
+
+
+def bench_surface(image_data, series_key, isovalues, size, render):
+    # A private service with an empty cache and mesh store, so every isovalue is really extracted
+    store = MeshStore(os.path.join(SCRATCH, "meshes"))
+    viewer.isosurface_service = IsosurfaceService(store=store)
+    results = {}
+    for isovalue in isovalues:
+        visualizer = Visualizer(None, "surface", image_data=image_data, series_key=series_key, isovalue=isovalue)
+        extract, actor = seconds(visualizer.surface_rendering)
+        entry = {"surface_rendering_s": extract, "triangles": actor.GetMapper().GetInput().GetNumberOfPolys()}
+        if render:
+            window = offscreen_window(size)
+            renderer = vtk.vtkRenderer()
+            renderer.AddActor(actor)
+            window.AddRenderer(renderer)
+            entry["first_frame_s"], _ = seconds(window.Render)
+        results[str(isovalue)] = entry
+    results["cached_repeat_s"], _ = seconds(
+        lambda: Visualizer(None, "surface", image_data=image_data, series_key=series_key, isovalue=isovalues[0]).surface_rendering()
+    )
+
+    # A new session: empty memory cache, surfaces mapped back from the mesh store
+    viewer.isosurface_service = IsosurfaceService(store=store)
+    results["store_reopen_s"], _ = seconds(
+        lambda: Visualizer(None, "surface", image_data=image_data, series_key=series_key, isovalue=isovalues[0]).surface_rendering()
+    )
+    return results
+
+
+def bench_slices(image_data, size):
+    viewers = Visualizer(None, "raycast", image_data=image_data).get_mpr_viewers()
+    results = {}
+    for view in viewers:
+        samples = []
+        for index in range(0, view.slice_max() + 1, max(view.slice_max() // 100, 1)):
+            def step():
+                view.set_slice(index)
+                QPixmap.fromImage(view.render(*size))
+            samples.append(seconds(step)[0])
+        results[view.orientation] = step_stats(samples)
+
+    # Window/level: one LUT change, then the three visible slices are remapped
+    samples = []
+    for step in range(100):
+        def update():
+            viewers[0].set_window_level(200 + step * 10, 40 + step)
+            for view in viewers:
+                QPixmap.fromImage(view.render(*size))
+        samples.append(seconds(update)[0])
+    results["window_level"] = step_stats(samples)
+    return results
+
+
+def bench_filters(image_data, kernel, sigma, intensity):
+    visualizer = Visualizer(None, "raycast", image_data=image_data)
+    results = {
+        "denoise_s": seconds(lambda: visualizer.apply_noise_reduction_filter(image_data, kernel))[0],
+        "smooth_s": seconds(lambda: visualizer.apply_smoothing_filter(image_data, sigma))[0],
+        "sharpen_s": seconds(lambda: visualizer.apply_sharpening_filter(image_data, intensity))[0],
+    }
+    chain = FilterChain([("denoise", kernel), ("smooth", sigma), ("sharpen", intensity)])
+    middle = image_data.GetDimensions()[2] // 2
+    results["chain_preview_axial_s"] = seconds(lambda: visualizer.preview_filter_chain(chain, 0, middle))[0]
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=""):
+    # Timing leaves only, e.g. "load.pydicom_threads_s" or "slices.axial.p95_ms"
+    flat = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, float) and (name.endswith("_s") or name.endswith("_ms")):
+            flat[path] = value
+    return flat
+
+
+def compare(results, baseline, threshold):
+    current, previous = flatten(results["stages"]), flatten(baseline["stages"])
+    regressions = []
+    for path in sorted(current.keys() & previous.keys()):
+        if previous[path] > 0 and current[path] / previous[path] > threshold:
+            regressions.append((path, previous[path], current[path]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=(100, 256, 256), metavar=("Z", "Y", "X"))
+    parser.add_argument("--series", help="Benchmark this DICOM folder instead of a synthetic series")
+    parser.add_argument("--isovalues", type=float, nargs="+", default=[-500.0, 300.0, 1000.0])
+    parser.add_argument("--kernel", type=int, default=3, help="Median kernel size")
+    parser.add_argument("--sigma", type=float, default=1.0, help="Gaussian standard deviation")
+    parser.add_argument("--intensity", type=float, default=0.5, help="Sharpening intensity")
+    parser.add_argument("--size", type=int, nargs=2, default=(512, 512), metavar=("W", "H"), help="View size")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841 (QPixmap needs an application)
+
+    if args.series:
+        folder = args.series
+        generate_s = 0.0
+    else:
+        folder = os.path.join(SCRATCH, "series")
+        generate_s, _ = seconds(lambda: write_series(folder, tuple(args.shape)))
+    files = sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+    render = render_available()
+    stages = {}
+    volume, stages["load"] = bench_load(folder, files)
+    image_data = to_vtk_image(volume)
+    series_key = (folder, fingerprint(files))
+
+    if render:
+        stages["raycast"] = bench_raycast(image_data, args.size)
+        stages["raycast_cpu"] = bench_raycast(image_data, args.size, "cpu")
+    else:
+        stages["raycast"] = stages["raycast_cpu"] = {"skipped": "no OpenGL context available"}
+    stages["surface"] = bench_surface(image_data, series_key, args.isovalues, args.size, render)
+    stages["slices"] = bench_slices(image_data, args.size)
+    stages["filters"] = bench_filters(image_data, args.kernel, args.sigma, args.intensity)
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "vtk": vtk.vtkVersion.GetVTKVersion(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+            "shape": list(volume.array.shape),
+            "dtype": str(volume.array.dtype),
+            "render": render,
+            "generate_s": generate_s,
+        },
+        "stages": stages,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for path, before, after in regressions:
+            print(f"REGRESSION {path}: {before:.4g} -> {after:.4g} (x{after / before:.2f})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
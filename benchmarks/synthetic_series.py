@@ -0,0 +1,112 @@
+"""
+Writes synthetic CT-like DICOM series for benchmarking; no patient data involved.
+
+    python benchmarks/synthetic_series.py /tmp/phantom --shape 300 512 512
+"""
+import argparse
+import os
+
+import numpy as np
+from pydicom.dataset import FileDataset, FileMetaDataset
+from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+
+def phantom_slice(z, shape, rng):
+    """
+    One axial slice of a torso-like phantom in Hounsfield units.
+
+    Air outside an elliptic body of soft tissue, two lungs, a spine and a ring of ribs,
+    with Gaussian noise so filters and isosurfaces have realistic work to do.
+    """
+    nz, ny, nx = shape
+    y, x = np.mgrid[-1:1:ny * 1j, -1:1:nx * 1j]
+    t = z / max(nz - 1, 1)
+
+    hu = np.full((ny, nx), -1000.0)
+    body = (x / 0.9) ** 2 + (y / 0.7) ** 2
+    hu[body < 1.0] = 40.0
+    hu[(body < 0.95) & (body > 0.8)] = 700.0 if int(t * 20) % 2 == 0 else 40.0  # ribs come and go along z
+    for side in (-0.4, 0.4):
+        lung = ((x - side) / (0.3 + 0.05 * np.sin(np.pi * t))) ** 2 + (y / 0.45) ** 2
+        hu[lung < 1.0] = -800.0
+    spine = x ** 2 + ((y - 0.5) / 0.12) ** 2
+    hu[spine < 0.12 ** 2 * 2] = 1200.0
+
+    hu += rng.normal(0.0, 20.0, hu.shape)
+    return hu
+
+
+def write_series(folder, shape=(100, 256, 256), spacing=(0.7, 0.7, 1.25), seed=0):
+    """
+    Writes one CT series of shape (slices, rows, columns) into folder.
+
+    Args:
+        folder: Output directory, created if needed.
+        shape: (z, y, x) voxel counts.
+        spacing: (x, y, z) voxel spacing in millimetres.
+        seed: Noise seed, so runs are reproducible.
+
+    Returns:
+        The list of written file paths, in slice order.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    study_uid, series_uid, frame_uid = generate_uid(), generate_uid(), generate_uid()
+    nz, ny, nx = shape
+
+    paths = []
+    for z in range(nz):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = CTImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        path = os.path.join(folder, f"slice_{z:04d}.dcm")
+        ds = FileDataset(path, {}, file_meta=meta, preamble=b"\0" * 128)
+        ds.SOPClassUID = CTImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.FrameOfReferenceUID = frame_uid
+        ds.Modality = "CT"
+        ds.PatientName = "Synthetic^Phantom"
+        ds.PatientID = "SYNTHETIC"
+        ds.SeriesDescription = f"Synthetic phantom {nz}x{ny}x{nx}"
+        ds.SeriesNumber = 1
+        ds.InstanceNumber = z + 1
+
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [0.0, 0.0, z * spacing[2]]
+        ds.PixelSpacing = [spacing[1], spacing[0]]
+        ds.SliceThickness = spacing[2]
+
+        ds.Rows, ds.Columns = ny, nx
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.RescaleSlope = 1
+        ds.RescaleIntercept = -1024
+
+        stored = np.clip(phantom_slice(z, shape, rng) + 1024.0, 0, 65535).astype(np.uint16)
+        ds.PixelData = stored.tobytes()
+        ds.save_as(path, enforce_file_format=True)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder")
+    parser.add_argument("--shape", type=int, nargs=3, default=(100, 256, 256), metavar=("Z", "Y", "X"))
+    parser.add_argument("--spacing", type=float, nargs=3, default=(0.7, 0.7, 1.25), metavar=("X", "Y", "Z"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = write_series(args.folder, tuple(args.shape), tuple(args.spacing), args.seed)
+    print(f"Wrote {len(paths)} slices to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def _reduce_axis(array, brick_size, axis, reduce):
+    # Whole bricks reduce through a reshape; a ragged last brick is reduced on its own
+    n = array.shape[axis]
+    whole = n // brick_size * brick_size
+    lead = (slice(None),) * axis
+    shape = array.shape[:axis] + (whole // brick_size, brick_size) + array.shape[axis + 1:]
+    parts = [reduce.reduce(array[lead + (slice(0, whole),)].reshape(shape), axis=axis + 1)] if whole else []
+    if whole < n:
+        parts.append(reduce.reduce(array[lead + (slice(whole, n),)], axis=axis, keepdims=True))
+    return np.concatenate(parts, axis=axis) if len(parts) > 1 else parts[0]
+
+
+def _reduce_blocks(array, brick_size):
+    # Min and max of every brick_size**3 block, reducing the slowest axis first so later passes are small
+    minima = _reduce_axis(array, brick_size, 0, np.minimum)
+    maxima = _reduce_axis(array, brick_size, 0, np.maximum)
+    for axis in (1, 2):
+        minima = _reduce_axis(minima, brick_size, axis, np.minimum)
+        maxima = _reduce_axis(maxima, brick_size, axis, np.maximum)
+    return minima, maxima
+
+
+def _extend_to_next(values, reduce):
+    # A brick's cells reach the first voxel of the next brick, so fold the neighbour's range in
+    for axis in range(3):
+        head = [slice(None)] * 3
+        tail = [slice(None)] * 3
+        head[axis] = slice(0, -1)
+        tail[axis] = slice(1, None)
+        reduce(values[tuple(head)], values[tuple(tail)], out=values[tuple(head)])
+    return values
+
+
+class BrickIndex:
+    """
+    Per-brick scalar min/max of a volume, used to skip regions an isosurface cannot cross.
+
+    The ranges are conservative: each brick also covers the boundary voxels it shares
+    with its neighbours, so every cell that can hold part of a surface falls in at least
+    one active brick.
+
+    Args:
+        minima: (bz, by, bx) array of brick minima.
+        maxima: (bz, by, bx) array of brick maxima.
+        brick_size: Edge length of a brick in voxels.
+        shape: (z, y, x) shape of the indexed volume.
+    """
+
+    def __init__(self, minima, maxima, brick_size, shape):
+        self.minima = minima
+        self.maxima = maxima
+        self.brick_size = brick_size
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_array(cls, array, brick_size=16):
+        # An empty volume has no bricks to index
+        if not array.size:
+            return None
+        minima, maxima = _reduce_blocks(array, brick_size)
+        minima = _extend_to_next(np.array(minima), np.minimum)
+        maxima = _extend_to_next(np.array(maxima), np.maximum)
+        return cls(minima, maxima, brick_size, array.shape)
+
+    def value_range(self):
+        return self.minima.min().item(), self.maxima.max().item()
+
+    def active(self, isovalue):
+        # Bricks whose range straddles the isovalue
+        return (self.minima <= isovalue) & (self.maxima >= isovalue)
+
+    def extents(self, isovalue):
+        """
+        VTK extents (x0, x1, y0, y1, z0, z1) covering the active bricks.
+
+        Adjacent active bricks along x are merged into a single extent to keep the
+        number of pieces down. Neighbouring extents share their boundary voxels, so the
+        pieces tile the volume's cells without gaps or overlaps.
+        """
+        nz, ny, nx = self.shape
+        b = self.brick_size
+        active = self.active(isovalue)
+        extents = []
+        for k, j in zip(*np.nonzero(active.any(axis=2))):
+            row = np.concatenate(([False], active[k, j], [False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+            for start, stop in zip(edges[::2], edges[1::2]):
+                extent = [
+                    start * b, min(stop * b, nx - 1),
+                    j * b, min((j + 1) * b, ny - 1),
+                    k * b, min((k + 1) * b, nz - 1),
+                ]
+                # Pieces one voxel thick hold no cells
+                if extent[0] < extent[1] and extent[2] < extent[3] and extent[4] < extent[5]:
+                    extents.append(tuple(int(v) for v in extent))
+        return extents
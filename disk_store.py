@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "DICOM_VIEWER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dicom-viewer")
+)
+
+
+class DiskStore:
+    """
+    Directory of cache entries, each a small JSON header next to raw .npy arrays.
+
+    Entries are written under temporary names and renamed into place, so a crash never
+    leaves a half-written entry behind. Loading an entry touches its header, and once
+    the arrays grow past the size cap the least recently used entries are removed; the
+    newest entry is always kept. Subclasses name an entry's files through _paths() and
+    decide which older entries a save makes stale.
+
+    Args:
+        root: Directory holding the entries.
+        budget_bytes: Size cap of the stored arrays.
+    """
+
+    def __init__(self, root, budget_bytes):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, base):
+        """
+        Returns ({array name: .npy path}, header path) of the entry at base.
+        """
+        raise NotImplementedError
+
+    def _read_header(self, header_path):
+        try:
+            with open(header_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, header_path):
+        # Loads mark the entry as recently used for eviction
+        os.utime(header_path)
+
+    def _write(self, base, arrays, header):
+        """
+        Writes an entry's arrays and header atomically, then drops stale entries and
+        enforces the size cap.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        array_paths, header_path = self._paths(base)
+        # Unique temporaries, since two threads may save the same entry at once (e.g. the
+        # GUI and a refine worker); whichever rename lands last wins with a whole entry
+        temporary = {}
+        try:
+            for name, array in arrays.items():
+                temporary[array_paths[name]] = self._temporary(lambda f, array=array: np.save(f, array), "wb")
+            temporary[header_path] = self._temporary(lambda f: json.dump(header, f), "w")
+            for path, temporary_path in temporary.items():
+                os.replace(temporary_path, path)
+        except OSError:
+            # A full disk must not leave partial temporaries behind to fill it further
+            for temporary_path in temporary.values():
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+            raise
+
+        with self._lock:
+            self._drop_stale(header, header_path)
+            self._evict()
+
+    def _temporary(self, write, mode):
+        # Writes through write(file) into a new uniquely named file in the store; returns its path
+        fd, path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as f:
+                write(f)
+        except OSError:
+            os.remove(path)
+            raise
+        return path
+
+    def _is_stale(self, header, other):
+        # Whether the entry with header other can no longer be hit once header is saved
+        return False
+
+    def _headers(self):
+        if not os.path.isdir(self.root):
+            return []
+        with os.scandir(self.root) as entries:
+            return [entry.path for entry in entries if entry.name.endswith(".json")]
+
+    def _remove(self, header_path):
+        array_paths, _ = self._paths(header_path[: -len(".json")])
+        for path in list(array_paths.values()) + [header_path]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _drop_stale(self, header, keep_header_path):
+        for header_path in self._headers():
+            if header_path == keep_header_path:
+                continue
+            other = self._read_header(header_path)
+            if other is None or self._is_stale(header, other):
+                self._remove(header_path)
+
+    def _size(self, header_path):
+        # Optional arrays an entry does not have are simply absent
+        array_paths, _ = self._paths(header_path[: -len(".json")])
+        return sum(os.path.getsize(path) for path in array_paths.values() if os.path.exists(path))
+
+    def nbytes(self):
+        total = 0
+        for header_path in self._headers():
+            try:
+                total += self._size(header_path)
+            except OSError:
+                pass
+        return total
+
+    def _evict(self):
+        entries = []
+        for header_path in self._headers():
+            try:
+                entries.append((os.path.getmtime(header_path), self._size(header_path), header_path))
+            except OSError:
+                self._remove(header_path)
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while len(entries) > 1 and total > self.budget_bytes:
+            _, size, header_path = entries.pop(0)
+            self._remove(header_path)
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            for header_path in self._headers():
+                self._remove(header_path)
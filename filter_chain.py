@@ -0,0 +1,190 @@
+import os
+import threading
+from collections import OrderedDict
+
+from memory import memory_manager
+from series_loader import image_to_array
+from volume_cache import image_nbytes
+
+
+DEFAULT_FILTER_BUDGET_MB = int(os.environ.get("DICOM_VIEWER_FILTER_CACHE_MB", "1024"))
+
+# Stages always run in this order, whichever filter was enabled last
+FILTER_ORDER = ("denoise", "smooth", "sharpen")
+
+
+def stage_radius(name, parameter):
+    # Voxels each stage reads on either side of an output voxel
+    if name == "denoise":
+        return int(parameter) // 2
+    if name == "smooth":
+        # vtkImageGaussianSmooth truncates its kernel at 1.5 standard deviations
+        return int(parameter * 1.5)
+    return 1
+
+
+class FilterChain:
+    """
+    An ordered, hashable list of filter stages, each a (name, parameter) pair.
+
+    Args:
+        stages: Iterable of (name, parameter) pairs with names from FILTER_ORDER; they are
+            put in FILTER_ORDER and each name may appear once.
+    """
+
+    def __init__(self, stages=()):
+        stages = dict(stages)
+        self.stages = tuple((name, stages[name]) for name in FILTER_ORDER if name in stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterChain) and self.stages == other.stages
+
+    def __hash__(self):
+        return hash(self.stages)
+
+    def prefix(self, length):
+        return FilterChain(self.stages[:length])
+
+    def radius(self):
+        return sum(stage_radius(name, parameter) for name, parameter in self.stages)
+
+    def derived_key(self, series_key):
+        # Surfaces and caches of a filtered volume are keyed by its source series plus the chain
+        if series_key is None or not self.stages:
+            return series_key
+        return (series_key, self.stages)
+
+
+class FilterChainCache:
+    """
+    Memoizes the output of every prefix of a filter chain, LRU with a memory budget.
+
+    Changing the last stage of a chain only recomputes that stage; the volume produced
+    by the unchanged prefix is reused.
+
+    Args:
+        budget_bytes: Memory the filtered volumes may take before the oldest are dropped.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_FILTER_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image_data = self._entries.get(key)
+            if image_data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        memory_manager.touch("filters", key)
+        return image_data
+
+    def put(self, key, image_data):
+        evicted = []
+        with self._lock:
+            self._entries[key] = image_data
+            self._entries.move_to_end(key)
+            total = sum(image_nbytes(image) for image in self._entries.values())
+            while len(self._entries) > 1 and total > self.budget_bytes:
+                evicted_key, evicted_image = self._entries.popitem(last=False)
+                total -= image_nbytes(evicted_image)
+                evicted.append(evicted_key)
+        for evicted_key in evicted:
+            memory_manager.release("filters", evicted_key)
+        memory_manager.track("filters", key, image_data, "filtered", evict=self.discard)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        memory_manager.release_owner("filters")
+
+    def run(self, series_key, image_data, chain, filters, job=None):
+        """
+        Applies a chain to a volume, starting from the longest memoized prefix.
+
+        Args:
+            series_key: Key of the source volume; None disables memoization.
+            image_data: The source vtkImageData.
+            chain: The FilterChain to apply.
+            filters: Mapping from stage name to callable(image_data, parameter, job).
+            job: Optional FilterJob for progress and cancellation.
+
+        Returns:
+            The filtered vtkImageData (the source itself for an empty chain), or None if
+            the job was cancelled.
+        """
+        output, start = image_data, 0
+        if series_key is not None:
+            for length in range(len(chain), 0, -1):
+                cached = self.get(chain.prefix(length).derived_key(series_key))
+                if cached is not None:
+                    output, start = cached, length
+                    break
+
+        for index in range(start, len(chain)):
+            if job is not None:
+                job.set_stage(index - start, len(chain) - start)
+            name, parameter = chain.stages[index]
+            output = filters[name](output, parameter, job)
+            if job is not None and job.cancelled:
+                return None
+            if series_key is not None:
+                self.put(chain.prefix(index + 1).derived_key(series_key), output)
+        return output
+
+
+def preview_slice(image_data, chain, filters, axis, index, job=None):
+    """
+    Applies a chain to a single slice of a volume, exactly as the full run would.
+
+    Each stage computes only the slab the remaining stages still need around the slice,
+    shrinking by its own radius, so the last stage produces one slice. The cost depends
+    on the kernel sizes and the slice area, not on the number of slices.
+
+    Args:
+        image_data: The source vtkImageData.
+        chain: The FilterChain to apply.
+        filters: Mapping from stage name to callable(image_data, parameter, job, extent).
+        axis: Volume axis of the slice in (z, y, x) order.
+        index: Slice index along that axis.
+        job: Optional FilterJob for progress and cancellation.
+
+    Returns:
+        The filtered (vertical, horizontal) plane as a numpy array, or None if the job
+        was cancelled.
+    """
+    output = image_data
+    whole = image_data.GetExtent()
+    vtk_axis = 2 - axis
+    remaining = chain.radius()
+    for position, (name, parameter) in enumerate(chain.stages):
+        remaining -= stage_radius(name, parameter)
+        extent = list(whole)
+        extent[2 * vtk_axis] = max(index - remaining, whole[2 * vtk_axis])
+        extent[2 * vtk_axis + 1] = min(index + remaining, whole[2 * vtk_axis + 1])
+        if job is not None:
+            job.set_stage(position, len(chain))
+        output = filters[name](output, parameter, job, extent)
+        if job is not None and job.cancelled:
+            return None
+
+    # The output holds at least the requested slab; pick the slice out of it
+    array = image_to_array(output)
+    offset = index - output.GetExtent()[2 * vtk_axis]
+    return array.take(offset, axis=axis)
+
+
+# Shared instance used across the application
+filter_cache = FilterChainCache()
@@ -0,0 +1,100 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# VTK image filters are multithreaded themselves; the extra worker lets a new job start while a cancelled one unwinds
+DEFAULT_FILTER_WORKERS = int(os.environ.get("DICOM_VIEWER_FILTER_WORKERS", "2"))
+
+
+class FilterJob:
+    """
+    One filter run on the worker pool, with progress reporting and cancellation.
+
+    The job function receives the FilterJob and passes every VTK filter it updates
+    through watch(), which forwards the filter's progress events and aborts its
+    execution once the job is cancelled.
+
+    Args:
+        on_progress: Optional callable(job, fraction), called on the worker thread.
+        on_done: Optional callable(job, result), called on the worker thread; the
+            result is None when the job was cancelled or failed.
+    """
+
+    def __init__(self, on_progress=None, on_done=None):
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.progress = 0.0
+        self.stage = (0, 1)
+        self.error = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def set_stage(self, index, count):
+        # Multi-stage jobs report each stage's progress as its share of the whole run
+        self.stage = (index, max(count, 1))
+
+    def report(self, fraction):
+        index, count = self.stage
+        fraction = (index + fraction) / count
+        # Only whole percent steps are forwarded, so the GUI is not flooded with events
+        if int(fraction * 100) == int(self.progress * 100):
+            return
+        self.progress = fraction
+        if self.on_progress is not None:
+            self.on_progress(self, fraction)
+
+    def watch(self, image_filter):
+        def on_progress(algorithm, event):
+            if self.cancelled:
+                algorithm.SetAbortExecute(1)
+            else:
+                self.report(algorithm.GetProgress())
+
+        image_filter.AddObserver("ProgressEvent", on_progress)
+        return image_filter
+
+
+class FilterRunner:
+    """
+    Runs filter jobs on a small worker pool so the GUI thread never waits on Update().
+
+    Args:
+        workers: Number of jobs that may run at once.
+    """
+
+    def __init__(self, workers=DEFAULT_FILTER_WORKERS):
+        self._executor = ThreadPoolExecutor(max(workers, 1))
+
+    def submit(self, run, on_progress=None, on_done=None):
+        """
+        Queues run(job) and returns the FilterJob controlling it.
+        """
+        job = FilterJob(on_progress, on_done)
+        job.future = self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job, run):
+        result = None
+        if not job.cancelled:
+            try:
+                result = run(job)
+            except Exception as error:
+                job.error = error
+        # An aborted VTK filter leaves a partial volume behind; it is never handed out
+        if job.cancelled:
+            result = None
+        if job.on_done is not None:
+            job.on_done(job, result)
+        return result
+
+
+# Shared instance used across the application
+filter_runner = FilterRunner()
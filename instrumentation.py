@@ -0,0 +1,156 @@
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+# Chrome trace (chrome://tracing, Perfetto) written here when set; unset keeps only the rolling figures
+TRACE_PATH = os.environ.get("DICOM_VIEWER_TRACE")
+
+# "0" turns every span into a no-op
+ENABLED = os.environ.get("DICOM_VIEWER_PROFILE", "1") != "0"
+
+
+def process_trace_path(trace_path):
+    # Spawned workers import this module again; each writes its own file next to the main trace.
+    # Their name is set before the main module is re-imported, unlike parent_process()
+    if multiprocessing.current_process().name == "MainProcess":
+        return trace_path
+    root, ext = os.path.splitext(trace_path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+class _NullSpan:
+    # Shared no-op span handed out when instrumentation is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("owner", "name", "args", "start")
+
+    def __init__(self, owner, name, args):
+        self.owner = owner
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Instrumentation:
+    """
+    Timed spans with rolling percentiles per stage, optionally logged as a Chrome trace.
+
+    A span costs two clock reads and a deque append; with tracing on, each one is also
+    buffered as a complete ("X") trace event and written out in batches. The trace uses
+    the JSON array format, which viewers accept without the closing bracket, so a crash
+    loses at most the last batch. Worker processes write to "<trace>.<pid>.json" instead,
+    so they never truncate the main process' trace.
+
+    Args:
+        trace_path: Chrome trace file of the main process, or None.
+        window: Number of recent durations kept per span name.
+        enabled: False makes span() return a shared no-op.
+    """
+
+    def __init__(self, trace_path=TRACE_PATH, window=200, enabled=ENABLED):
+        self.enabled = enabled
+        self.window = window
+        self._durations = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._events = []
+        self._trace = None
+        if enabled and trace_path:
+            self._trace = open(process_trace_path(trace_path), "w")
+            self._trace.write("[\n")
+            atexit.register(self.flush)
+
+    def span(self, name, **args):
+        """
+        Context manager timing one stage, e.g. ``with span("surface.extract", isovalue=300):``.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = deque(maxlen=self.window)
+            durations.append(end_ns - start_ns)
+
+            if self._trace is not None:
+                self._events.append({
+                    "name": name,
+                    "cat": name.split(".")[0],
+                    "ph": "X",
+                    "ts": (start_ns - self._origin) / 1000.0,
+                    "dur": (end_ns - start_ns) / 1000.0,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args or {},
+                })
+                if len(self._events) >= 256:
+                    self._write_events()
+
+    def _write_events(self):
+        for event in self._events:
+            self._trace.write(json.dumps(event, default=str))
+            self._trace.write(",\n")
+        self._events = []
+        self._trace.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._trace is not None:
+                self._write_events()
+
+    def percentiles(self, name):
+        """
+        Returns (count, p50_ms, p95_ms) over the recent durations of a span, or None.
+        """
+        with self._lock:
+            durations = self._durations.get(name)
+            if not durations:
+                return None
+            samples = np.fromiter(durations, dtype=np.float64, count=len(durations))
+        p50, p95 = np.percentile(samples, (50, 95)) / 1e6
+        return len(samples), float(p50), float(p95)
+
+    def status_text(self, labels):
+        """
+        One status bar line of "label p50/p95 ms" for the spans that have run.
+
+        Args:
+            labels: Mapping from span name to the short label shown for it.
+        """
+        parts = []
+        for name, label in labels.items():
+            figures = self.percentiles(name)
+            if figures is not None:
+                parts.append(f"{label} {figures[1]:.1f}/{figures[2]:.1f}")
+        return ("p50/p95 ms: " + "  ".join(parts)) if parts else ""
+
+
+# Shared instance used across the application
+instrumentation = Instrumentation()
+span = instrumentation.span
@@ -0,0 +1,370 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import vtk
+
+from brick_index import BrickIndex
+from instrumentation import span
+from memory import memory_manager
+from mesh_store import mesh_store
+from series_loader import image_to_array
+from surface_lod import forget
+
+
+DEFAULT_MESH_BUDGET_MB = int(os.environ.get("DICOM_VIEWER_MESH_CACHE_MB", "1024"))
+
+# "marching_cubes" or the multithreaded "flying_edges"; 0 threads leaves VTK's SMP default
+DEFAULT_EXTRACTOR = os.environ.get("DICOM_VIEWER_SURFACE_EXTRACTOR", "marching_cubes")
+DEFAULT_THREADS = int(os.environ.get("DICOM_VIEWER_THREADS", "0"))
+
+# Edge length of the min/max bricks used to skip empty regions; 0 contours the whole volume
+DEFAULT_BRICK_SIZE = int(os.environ.get("DICOM_VIEWER_BRICK_SIZE", "16"))
+
+EXTRACTORS = {
+    "marching_cubes": vtk.vtkMarchingCubes,
+    "flying_edges": vtk.vtkFlyingEdges3D,
+}
+
+
+def detached(image_data):
+    # A shallow copy shares the voxels but not pipeline state, so worker threads can read it safely
+    copy = vtk.vtkImageData()
+    copy.ShallowCopy(image_data)
+    return copy
+
+
+def downsample(image_data, factor):
+    """
+    Builds a proxy volume reduced by factor along every axis, averaging each block of voxels.
+    """
+    shrink = vtk.vtkImageShrink3D()
+    shrink.SetInputData(detached(image_data))
+    shrink.SetShrinkFactors(factor, factor, factor)
+    shrink.AveragingOn()
+    shrink.Update()
+
+    proxy = vtk.vtkImageData()
+    proxy.ShallowCopy(shrink.GetOutput())
+    return proxy
+
+
+def contour_bricks(image_data, isovalue, extractor, brick_index):
+    # Contour only the active bricks and merge the partial meshes
+    source = detached(image_data)
+    append = vtk.vtkAppendPolyData()
+    for extent in brick_index.extents(isovalue):
+        voi = vtk.vtkExtractVOI()
+        voi.SetInputData(source)
+        voi.SetVOI(*extent)
+
+        piece_extractor = EXTRACTORS[extractor]()
+        piece_extractor.SetInputConnection(voi.GetOutputPort())
+        piece_extractor.SetValue(0, isovalue)
+        piece_extractor.Update()
+
+        piece = vtk.vtkPolyData()
+        piece.ShallowCopy(piece_extractor.GetOutput())
+        append.AddInputData(piece)
+
+    if append.GetNumberOfInputConnections(0) == 0:
+        append.AddInputData(vtk.vtkPolyData())
+    return append
+
+
+def extract_isosurface(image_data, isovalue, smoothing=(0, 0.1), extractor=DEFAULT_EXTRACTOR, brick_index=None):
+    """
+    Contours one isovalue and returns a standalone vtkPolyData.
+
+    Args:
+        image_data: The vtkImageData volume.
+        isovalue: Scalar value of the surface.
+        smoothing: (iterations, pass band) for windowed sinc smoothing; 0 iterations disables it.
+        extractor: "marching_cubes" or "flying_edges".
+        brick_index: Optional BrickIndex of the volume; only bricks straddling the isovalue are contoured.
+    """
+    if brick_index is not None:
+        surface_extractor = contour_bricks(image_data, isovalue, extractor, brick_index)
+    else:
+        surface_extractor = EXTRACTORS[extractor]()
+        surface_extractor.SetInputData(detached(image_data))
+        surface_extractor.SetValue(0, isovalue)
+    output_port = surface_extractor.GetOutputPort()
+
+    iterations, pass_band = smoothing
+    if iterations:
+        if brick_index is not None:
+            # Brick pieces duplicate the points on shared faces; weld them so smoothing cannot open seams
+            cleaner = vtk.vtkCleanPolyData()
+            cleaner.SetInputConnection(output_port)
+            cleaner.PointMergingOn()
+            output_port = cleaner.GetOutputPort()
+
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputConnection(output_port)
+        smoother.SetNumberOfIterations(iterations)
+        smoother.SetPassBand(pass_band)
+        smoother.NormalizeCoordinatesOn()
+        output_port = smoother.GetOutputPort()
+
+    output_port.GetProducer().Update()
+    surface = vtk.vtkPolyData()
+    surface.ShallowCopy(output_port.GetProducer().GetOutputDataObject(0))
+    return surface
+
+
+class IsosurfaceCache:
+    """
+    LRU of extracted surfaces keyed by (series, isovalue, smoothing) with a memory budget.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_MESH_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            surface = self._entries.get(key)
+            if surface is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        memory_manager.touch("surfaces", key)
+        return surface
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, surface):
+        evicted = []
+        with self._lock:
+            self._entries[key] = surface
+            self._entries.move_to_end(key)
+            total = sum(s.GetActualMemorySize() * 1024 for s in self._entries.values())
+            while len(self._entries) > 1 and total > self.budget_bytes:
+                evicted_key, evicted_surface = self._entries.popitem(last=False)
+                total -= evicted_surface.GetActualMemorySize() * 1024
+                evicted.append((evicted_key, evicted_surface))
+        for evicted_key, evicted_surface in evicted:
+            memory_manager.release("surfaces", evicted_key)
+            forget(evicted_surface)
+        # Keys are (series, isovalue, smoothing), plus ("preview", factor) for proxy surfaces
+        stage = "surface_preview" if len(key) > 3 else "surface"
+        memory_manager.track("surfaces", key, surface, stage, series_key=key[0], evict=self.discard)
+
+    def discard(self, key):
+        with self._lock:
+            surface = self._entries.pop(key, None)
+        if surface is not None:
+            forget(surface)
+
+    def clear(self):
+        with self._lock:
+            surfaces = list(self._entries.values())
+            self._entries.clear()
+        memory_manager.release_owner("surfaces")
+        for surface in surfaces:
+            forget(surface)
+
+
+class IsosurfaceService:
+    """
+    Memoizes surface extraction and precomputes surfaces for nearby isovalues in the background.
+
+    Foreground requests are answered from the cache when possible. While the slider is
+    being dragged, get_preview() contours a downsampled proxy volume instead, and
+    extract_async() produces the full resolution surface on a worker thread once it is
+    released. prefetch_around() queues the neighbouring slider values on another worker;
+    a newer call supersedes any prefetch that has not started yet, so the worker never
+    falls behind the slider.
+
+    Args:
+        cache: IsosurfaceCache to use; a new one by default.
+        step: Isovalue spacing of prefetched surfaces.
+        radius: Number of prefetched values on each side of the current one.
+        extractor: "marching_cubes" or the multithreaded "flying_edges".
+        threads: Thread count for VTK's SMP backend (used by flying edges); 0 keeps the default.
+        preview_factor: Per-axis downsampling of the proxy volume used while dragging.
+        brick_size: Brick edge of the min/max index used to skip empty regions; 0 disables it.
+        store: MeshStore persisting full resolution surfaces across sessions, or None.
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        step=10,
+        radius=3,
+        extractor=DEFAULT_EXTRACTOR,
+        threads=DEFAULT_THREADS,
+        preview_factor=2,
+        brick_size=DEFAULT_BRICK_SIZE,
+        store=mesh_store,
+    ):
+        self.cache = cache if cache is not None else IsosurfaceCache()
+        self.store = store
+        self.step = step
+        self.radius = radius
+        self.extractor = extractor
+        self.preview_factor = preview_factor
+        self.brick_size = brick_size
+        self.set_threads(threads)
+        self._foreground = ThreadPoolExecutor(1)
+        self._executor = ThreadPoolExecutor(1)
+        self._generation = 0
+        self._request = 0
+        self._proxies = OrderedDict()
+        self._brick_indices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set_threads(self, threads):
+        self.threads = threads
+        if threads:
+            vtk.vtkSMPTools.Initialize(threads)
+
+    def _extract(self, image_data, isovalue, smoothing, brick_index=None):
+        with span("isosurface.extract", isovalue=isovalue, bricks=brick_index is not None):
+            return extract_isosurface(image_data, isovalue, smoothing, self.extractor, brick_index)
+
+    def brick_index(self, series_key, image_data):
+        """
+        Returns the min/max brick index of a series, building it on first use, or None
+        for a volume without voxels.
+        """
+        if series_key is None or not self.brick_size:
+            return None
+        if not image_data.GetNumberOfPoints() or image_data.GetPointData().GetScalars() is None:
+            return None
+        with self._lock:
+            index = self._brick_indices.get(series_key)
+            if index is None:
+                with span("isosurface.brick_index"):
+                    index = BrickIndex.from_array(image_to_array(image_data), self.brick_size)
+                if index is None:
+                    return None
+                self._brick_indices[series_key] = index
+                while len(self._brick_indices) > 4:
+                    self._brick_indices.popitem(last=False)
+            return index
+
+    def get(self, series_key, image_data, isovalue, smoothing=(0, 0.1)):
+        # Without a series key (e.g. a volume still streaming in) there is nothing safe to memoize
+        if series_key is None:
+            return self._extract(image_data, isovalue, smoothing)
+
+        key = (series_key, isovalue, tuple(smoothing))
+        surface = self.cache.get(key)
+        if surface is None:
+            surface = self._stored(key)
+        if surface is None:
+            surface = self._extract(image_data, isovalue, smoothing, self.brick_index(series_key, image_data))
+            if self.store is not None:
+                with span("isosurface.store_save", isovalue=isovalue):
+                    try:
+                        self.store.save(key + (self.extractor,), surface)
+                    except OSError:
+                        # A full or read-only cache disk only costs the next session a re-extraction
+                        pass
+            self.cache.put(key, surface)
+        return surface
+
+    def _stored(self, key):
+        # A surface meshed in an earlier session maps straight back from the disk store
+        if self.store is None:
+            return None
+        with span("isosurface.store_load", isovalue=key[1]):
+            surface = self.store.load(key + (self.extractor,))
+        if surface is not None:
+            self.cache.put(key, surface)
+        return surface
+
+    def peek(self, series_key, isovalue, smoothing=(0, 0.1)):
+        # Full resolution surface if it is already cached (in memory or on disk), without extracting anything
+        if series_key is None:
+            return None
+        key = (series_key, isovalue, tuple(smoothing))
+        surface = self.cache.get(key)
+        if surface is None:
+            surface = self._stored(key)
+        return surface
+
+    def proxy(self, series_key, image_data):
+        key = (series_key, self.preview_factor)
+        proxy = self._proxies.get(key)
+        if proxy is None:
+            proxy = downsample(image_data, self.preview_factor)
+            if series_key is not None:
+                # Only the proxies of the last couple of series are worth keeping
+                self._proxies[key] = proxy
+                while len(self._proxies) > 2:
+                    memory_manager.release("proxies", self._proxies.popitem(last=False)[0])
+                memory_manager.track("proxies", key, proxy, "proxy", series_key=series_key, evict=self._drop_proxy)
+        return proxy
+
+    def _drop_proxy(self, key):
+        self._proxies.pop(key, None)
+
+    def get_preview(self, series_key, image_data, isovalue, smoothing=(0, 0.1)):
+        """
+        Returns a coarse surface from the downsampled proxy volume.
+        """
+        if series_key is None:
+            return self._extract(self.proxy(series_key, image_data), isovalue, smoothing)
+
+        key = (series_key, isovalue, tuple(smoothing), "preview", self.preview_factor)
+        surface = self.cache.get(key)
+        if surface is None:
+            surface = self._extract(self.proxy(series_key, image_data), isovalue, smoothing)
+            self.cache.put(key, surface)
+        return surface
+
+    def extract_async(self, series_key, image_data, isovalue, callback, smoothing=(0, 0.1)):
+        """
+        Extracts the full resolution surface on a worker thread.
+
+        callback(isovalue, surface) is called on that worker thread. Requests that are
+        superseded before they start are dropped.
+        """
+        self._request += 1
+        request = self._request
+        image_data = detached(image_data)
+
+        def run():
+            if request != self._request:
+                return
+            callback(isovalue, self.get(series_key, image_data, isovalue, smoothing))
+
+        self._foreground.submit(run)
+
+    def prefetch_around(self, series_key, image_data, isovalue, smoothing=(0, 0.1), value_range=None):
+        if series_key is None:
+            return
+        self._generation += 1
+        generation = self._generation
+
+        # Nearest values first, alternating above and below the current one
+        values = []
+        for offset in range(1, self.radius + 1):
+            for value in (isovalue + offset * self.step, isovalue - offset * self.step):
+                if value_range is None or value_range[0] <= value <= value_range[1]:
+                    values.append(value)
+
+        image_data = detached(image_data)
+        for value in values:
+            self._executor.submit(self._prefetch, generation, series_key, image_data, value, tuple(smoothing))
+
+    def _prefetch(self, generation, series_key, image_data, isovalue, smoothing):
+        key = (series_key, isovalue, smoothing)
+        if generation != self._generation or self.cache.contains(key) or self._stored(key) is not None:
+            return
+        # Speculative surfaces stay in memory only; the disk store keeps the ones actually shown
+        self.cache.put(key, self._extract(image_data, isovalue, smoothing, self.brick_index(series_key, image_data)))
+
+
+# Shared instance used across the application
+isosurface_service = IsosurfaceService()
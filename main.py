@@ -1,17 +1,38 @@
 from vtk.util import numpy_support
 import numpy as np
 
-from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtGui import QPixmap
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QShortcut, QFileDialog , QVBoxLayout
+from PyQt5.QtWidgets import QApplication, QMainWindow, QShortcut, QFileDialog , QVBoxLayout, QProgressBar, QPushButton, QLabel, QInputDialog, QMessageBox
 from PyQt5.QtGui import QKeySequence
+from PyQt5.QtCore import Qt, QObject, QElapsedTimer, QTimer, pyqtSignal
 from mainwindow import Ui_MainWindow  # Ensure this is your generated UI file
 from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
 import vtk
 import pydicom
 import os
+import sqlite3
+import threading
+import time
 import numpy as np
 
+from filter_chain import FilterChain, filter_cache, preview_slice
+from filter_jobs import filter_runner
+from instrumentation import instrumentation, span
+from memory import memory_manager
+from isosurface import detached, isosurface_service
+from surface_lod import DEFAULT_TRIANGLE_BUDGET, lod_for
+from mpr import SliceView, WindowLevelLUT
+from parallel_filters import slab_filter_engine
+from render_scheduler import RenderScheduler, VIEWS
+from roi import ROI, crop_image
+from study_index import study_index
+from series_loader import SeriesLoadError, SeriesVolume, fill_value, image_to_array, scan_series, stream_series, to_vtk_image
+from volume_cache import read_folder_volume, volume_cache
+from volume_stats import VolumeStats, attach_stats, opacity_points, stats_of
+from volume_mapper import DEFAULT_INTERACTIVE_FPS, DEFAULT_RENDER_MODE, make_volume_mapper, set_interactive_quality
+from volume_store import volume_store
+
 
 class Visualizer:
     def __init__(
@@ -24,6 +45,12 @@ class Visualizer:
         specular_power=10.0,
         isovalue=500,
         color=(0.0, 0.0, 1.0),
+        image_data=None,
+        series_key=None,
+        smoothing=(0, 0.1),
+        lod=True,
+        triangle_budget=DEFAULT_TRIANGLE_BUDGET,
+        render_mode=DEFAULT_RENDER_MODE,
     ):
         self.folder = folder
         self.mode = mode
@@ -32,27 +59,56 @@ class Visualizer:
         self.specular = specular
         self.specular_power = specular_power
         self.isovalue = isovalue
-        self.reader = vtk.vtkDICOMImageReader()
         self.color = color
-        
-        self.reader = vtk.vtkDICOMImageReader()
-        self.reader.SetDirectoryName(folder)
-        self.reader.Update()
+        self.image_data = image_data
+        self.series_key = series_key
+        self.smoothing = smoothing
+        self.render_mode = render_mode
+
+        # The loaded volume and the filter chain applied to it; image_data is the chain's output
+        self.source_data = image_data
+        self.source_key = series_key
+        self.filter_chain = FilterChain()
+
+        # Optional box of the loaded volume that rendering, surfaces and filters are limited to
+        self.roi = None
+        self.roi_data = None
+
+        # Live pipeline objects, kept so property changes can be applied in place
+        self.volume_mapper = None
+        self.volume_property = None
+        self.surface_mapper = None
+        self.surface_actor = None
+
+        # Level-of-detail surfaces: a decimated mesh is drawn while the camera moves
+        self.lod = lod
+        self.triangle_budget = triangle_budget
+        self.surface_lod = None
+        self.interactive = False
+
+        if folder and image_data is None:
+            self.read_data()
 
     def read_data(self):
-        # Read DICOM data
-        self.reader.SetDirectoryName(self.folder)
-        self.reader.Update()
+        # Fetch the volume from the shared cache; the folder is only parsed on a miss
+        with span("load.read", folder=self.folder):
+            self.series_key = volume_cache.key_for(self.folder)
+            self.image_data = volume_cache.fetch(self.series_key)
+        self.source_key = self.series_key
+        self.source_data = self.image_data
+        self.filter_chain = FilterChain()
+        self.roi = None
+        self.roi_data = None
 
     def raycast_rendering(self):
-        # Create volume mapper
-        volume_mapper = vtk.vtkSmartVolumeMapper()
-        volume_mapper.SetBlendModeToComposite()
-        volume_mapper.SetRequestedRenderModeToGPU()
-        volume_mapper.SetInputData(self.reader.GetOutput())
+        # Create volume mapper (GPU, or the multithreaded CPU ray caster)
+        volume_mapper = make_volume_mapper(self.image_data, self.render_mode)
+        set_interactive_quality(volume_mapper, self.interactive)
+        self.volume_mapper = volume_mapper
 
         # Create volume property
         volume_property = vtk.vtkVolumeProperty()
+        self.volume_property = volume_property
         volume_property.ShadeOn()
         volume_property.SetInterpolationTypeToLinear()
         volume_property.SetAmbient(self.ambient)
@@ -66,18 +122,10 @@ class Visualizer:
         gradient_opacity.AddPoint(2000.0, 1.0)
         volume_property.SetGradientOpacity(gradient_opacity)
 
-        # Set scalar opacity
+        # Set scalar opacity, seeded from the histogram for volumes that are not CT
         scalar_opacity = vtk.vtkPiecewiseFunction()
-        scalar_opacity.AddPoint(-800.0, 0.0)
-        scalar_opacity.AddPoint(-750.0, 1.0)
-        scalar_opacity.AddPoint(-350.0, 1.0)
-        scalar_opacity.AddPoint(-300.0, 0.0)
-        scalar_opacity.AddPoint(-200.0, 0.0)
-        scalar_opacity.AddPoint(-100.0, 1.0)
-        scalar_opacity.AddPoint(1000.0, 0.0)
-        scalar_opacity.AddPoint(2750.0, 0.0)
-        scalar_opacity.AddPoint(2976.0, 1.0)
-        scalar_opacity.AddPoint(3000.0, 0.0)
+        for value, opacity in opacity_points(self.stats):
+            scalar_opacity.AddPoint(value, opacity)
         volume_property.SetScalarOpacity(scalar_opacity)
 
         # Set color transfer function
@@ -98,25 +146,28 @@ class Visualizer:
         return volume
 
     def surface_rendering(self):
-        # Create surface extraction filter (marching cubes)
-        surface_extractor = vtk.vtkMarchingCubes()
-        surface_extractor.SetInputData(self.reader.GetOutput())
-        surface_extractor.SetValue(0, self.isovalue)
+        # Extract the surface (marching cubes), reusing any surface already cached for this isovalue
+        with span("surface.get", isovalue=self.isovalue):
+            surface = isosurface_service.get(self.series_key, self.image_data, self.isovalue, self.smoothing)
 
         # Create mapper and actor for the surface
         surface_mapper = vtk.vtkPolyDataMapper()
-        surface_mapper.SetInputConnection(surface_extractor.GetOutputPort())
         surface_mapper.ScalarVisibilityOff()
+        self.surface_mapper = surface_mapper
+        self.set_surface(surface)
 
         surface_actor = vtk.vtkActor()
         surface_actor.SetMapper(surface_mapper)
         surface_actor.GetProperty().SetColor(*self.color)
+        self.surface_actor = surface_actor
+        self.update_lighting(self.ambient, self.diffuse, self.specular, self.specular_power)
 
         # Return surface actor
         return surface_actor
 
     def render(self):
-        self.read_data()
+        if self.image_data is None:
+            self.read_data()
 
         # Create renderer and render window
         renderer = vtk.vtkRenderer()
@@ -133,70 +184,271 @@ class Visualizer:
 
         renderer.ResetCamera()
         return renderer
+
+    def update_lighting(self, ambient, diffuse, specular, specular_power):
+        # Shading changes go straight to the live properties; nothing is rebuilt
+        self.ambient = ambient
+        self.diffuse = diffuse
+        self.specular = specular
+        self.specular_power = specular_power
+
+        properties = []
+        if self.volume_property is not None:
+            properties.append(self.volume_property)
+        if self.surface_actor is not None:
+            properties.append(self.surface_actor.GetProperty())
+        for prop in properties:
+            prop.SetAmbient(ambient)
+            prop.SetDiffuse(diffuse)
+            prop.SetSpecular(specular)
+            prop.SetSpecularPower(specular_power)
+
+    def set_isovalue(self, isovalue, preview=False):
+        """
+        Swaps the surface on the existing mapper; cached isovalues cost nothing.
+
+        Args:
+            isovalue: The new isovalue.
+            preview: Show a surface from the downsampled proxy volume unless the full
+                resolution one is already cached. Follow up with refine_surface().
+        """
+        self.isovalue = isovalue
+        if self.surface_mapper is None:
+            return
+        with span("surface.isovalue", isovalue=isovalue, preview=preview):
+            if preview:
+                surface = isosurface_service.peek(self.series_key, isovalue, self.smoothing)
+                if surface is None:
+                    surface = isosurface_service.get_preview(self.series_key, self.image_data, isovalue, self.smoothing)
+            else:
+                surface = isosurface_service.get(self.series_key, self.image_data, isovalue, self.smoothing)
+            self.set_surface(surface)
+
+    def set_surface(self, surface):
+        # Show a surface on the live mapper, decimating it in the background if it is over budget
+        if self.lod and surface.GetNumberOfPolys() > self.triangle_budget:
+            self.surface_lod = lod_for(surface, self.triangle_budget, series_key=self.series_key)
+            self.show_lod_level()
+        else:
+            self.surface_lod = None
+            if self.surface_mapper is not None:
+                self.surface_mapper.SetInputData(surface)
+
+    def set_interactive(self, interactive):
+        # Called when camera interaction starts and stops
+        self.interactive = interactive
+        self.show_lod_level()
+        if self.volume_mapper is not None:
+            set_interactive_quality(self.volume_mapper, interactive)
+
+    def show_lod_level(self):
+        if self.surface_mapper is None or self.surface_lod is None:
+            return
+        if self.interactive:
+            self.surface_mapper.SetInputData(self.surface_lod.interactive_surface())
+        else:
+            self.surface_mapper.SetInputData(self.surface_lod.surface)
+
+    def refine_surface(self, callback):
+        # Extract the full resolution surface in the background; callback(isovalue, surface) runs on the worker
+        if self.surface_mapper is not None:
+            isosurface_service.extract_async(self.series_key, self.image_data, self.isovalue, callback, self.smoothing)
+
+    def show_surface(self, isovalue, surface):
+        # Ignore results for isovalues the slider has already moved past
+        if self.surface_mapper is not None and isovalue == self.isovalue:
+            self.set_surface(surface)
+            return True
+        return False
+
+    def prefetch_surfaces(self, value_range=None):
+        # Precompute neighbouring isovalues in the background while the slider is idle
+        if self.mode == "surface":
+            isosurface_service.prefetch_around(
+                self.series_key, self.image_data, self.isovalue, self.smoothing, value_range
+            )
     
     def get_mpr_viewers(self):
-            # Prepare three vtkImageViewer2 instances for Axial, Coronal, and Sagittal
-        viewers = [vtk.vtkImageViewer2() for _ in range(3)]
-        
-        # Axial
-        viewers[0].GetRenderWindow().SetOffScreenRendering(1)
-        viewers[0].SetInputConnection(self.reader.GetOutputPort())
-        viewers[0].SetSliceOrientationToXY()
-        
+        # Axial, Coronal and Sagittal views read straight from the cached voxel array and share one LUT
+        if not self.image_data.GetNumberOfPoints() or self.image_data.GetPointData().GetScalars() is None:
+            return []
+        array = image_to_array(self.image_data)
+        spacing = self.image_data.GetSpacing()
+        lut = WindowLevelLUT()
+        return [SliceView(array, spacing, orientation, lut) for orientation in ("axial", "coronal", "sagittal")]
+
+    @property
+    def stats(self):
+        # Histogram of the loaded volume, gathered while it was decoded (None while it streams in)
+        return stats_of(self.source_data)
+
+    def roi_source(self):
+        # The loaded volume cropped to the ROI, and the key data derived from it is cached under
+        if self.roi is None:
+            return self.source_key, self.source_data
+        key = None if self.source_key is None else (self.source_key, ("roi",) + self.roi.key())
+        return key, self.roi_data
+
+    def set_roi(self, roi):
+        """
+        Limits ray casting, surfaces and filters to a box of the loaded volume.
+
+        Only the box is rendered, contoured and filtered, so their memory and time shrink
+        with it. The filter chain is dropped; apply it again for the new box.
+
+        Args:
+            roi: The ROI in voxels of the loaded volume, or None for the whole volume.
+        """
+        if roi is not None and roi.covers(image_to_array(self.source_data).shape):
+            roi = None
+        self.roi = roi
+        self.roi_data = None if roi is None else crop_image(self.source_data, roi)
+        self.filter_chain = FilterChain()
+        self.series_key, self.image_data = self.roi_source()
+
+        # Only a copied crop holds voxels of its own; z-only crops are views of the loaded volume
+        if roi is not None and not np.shares_memory(image_to_array(self.roi_data), image_to_array(self.source_data)):
+            memory_manager.track("roi", self.series_key, self.roi_data, "roi", series_key=self.source_key)
 
-        # Coronal
-        viewers[1].GetRenderWindow().SetOffScreenRendering(1)
-        viewers[1].SetInputConnection(self.reader.GetOutputPort())
-        viewers[1].SetSliceOrientationToXZ()
+    def filters(self):
+        # Chain stage name -> callable(image_data, parameter, job)
+        return {
+            "denoise": self.apply_noise_reduction_filter,
+            "smooth": self.apply_smoothing_filter,
+            "sharpen": self.apply_sharpening_filter,
+        }
+
+    def apply_filter_chain(self, chain, job=None):
+        """
+        Filters the loaded volume (or ROI) through a chain, reusing memoized prefixes.
 
-        # Sagittal
-        viewers[2].GetRenderWindow().SetOffScreenRendering(1)
-        viewers[2].SetInputConnection(self.reader.GetOutputPort())
-        viewers[2].SetSliceOrientationToYZ()
+        Safe to call from a worker thread; pass the result to set_filtered() on the GUI
+        thread. Returns None if the job was cancelled.
+        """
+        key, image_data = self.roi_source()
+        return filter_cache.run(key, detached(image_data), chain, self.filters(), job)
+
+    def preview_filter_chain(self, chain, axis, index, job=None):
+        """
+        Filters only one slice of the loaded volume (or ROI) through a chain, for interactive tuning.
 
-        return viewers
+        Args:
+            chain: The FilterChain to preview.
+            axis: Volume axis of the slice in (z, y, x) order.
+            index: Slice index along that axis.
+            job: Optional FilterJob for progress and cancellation.
+
+        Returns:
+            The filtered 2D plane, or None if the job was cancelled.
+        """
+        with span("filter.preview", axis=axis, stages=len(chain)):
+            return preview_slice(detached(self.roi_source()[1]), chain, self.filters(), axis, index, job)
+
+    def set_filtered(self, chain, image_data):
+        # The filtered volume feeds ray casting and surfaces under its own key
+        self.filter_chain = chain
+        self.image_data = image_data
+        self.series_key = chain.derived_key(self.roi_source()[0])
+
+    def filtered_output(self, image_filter, job=None, extent=None):
+        # Run the filter, reporting progress to the job (which can abort it), and detach its output
+        if job is not None:
+            job.watch(image_filter)
+        with span("filter." + image_filter.GetClassName(), partial=extent is not None):
+            if extent is None:
+                image_filter.Update()
+            else:
+                # Only this part of the output is computed; VTK pulls just the input it depends on
+                image_filter.UpdateExtent(extent)
+
+        # Detach the filter output from its pipeline so only the volume stays alive
+        output = vtk.vtkImageData()
+        output.ShallowCopy(image_filter.GetOutput())
+        return output
     
-    def apply_sharpening_filter(self, viewer, reader, intensity=1.0):
+    def apply_sharpening_filter(self, image_data, intensity=1.0, job=None, extent=None):
+        # Work in float so the Laplacian and the difference below cannot overflow
+        as_float = vtk.vtkImageCast()
+        as_float.SetInputData(image_data)
+        as_float.SetOutputScalarTypeToFloat()
+
         # Create a Laplacian sharpening filter
-        sharpening_filter = vtk.vtkImageLaplacian()
-        sharpening_filter.SetInputConnection(reader.GetOutputPort())
-        sharpening_filter.SetDimensionality(3)  # Ensure it works in 3D
-        sharpening_filter.Update()
+        laplacian = vtk.vtkImageLaplacian()
+        laplacian.SetInputConnection(as_float.GetOutputPort())
+        laplacian.SetDimensionality(3)  # Ensure it works in 3D
+        if job is not None:
+            job.watch(laplacian)
+
+        # Subtracting the Laplacian boosts edges; intensity sets by how much
+        sharpening_filter = vtk.vtkImageWeightedSum()
+        sharpening_filter.AddInputConnection(as_float.GetOutputPort())
+        sharpening_filter.AddInputConnection(laplacian.GetOutputPort())
+        sharpening_filter.SetWeight(0, 1.0)
+        sharpening_filter.SetWeight(1, -intensity)
+        sharpening_filter.NormalizeByWeightOff()
 
-        # Apply the sharpened output to the viewer
-        viewer.SetInputConnection(sharpening_filter.GetOutputPort())
+        # Back to the volume's own type so the result stacks with the other filters
+        output_cast = vtk.vtkImageCast()
+        output_cast.SetInputConnection(sharpening_filter.GetOutputPort())
+        output_cast.SetOutputScalarType(image_data.GetScalarType())
+        output_cast.ClampOverflowOn()
+
+        # Return the sharpened volume
+        return self.filtered_output(output_cast, job, extent)
+
+    def apply_smoothing_filter(self, image_data, sigma=1.0, job=None, extent=None):
+        # Whole volumes are split into z-slabs filtered on every core
+        if extent is None and slab_filter_engine.parallel:
+            return slab_filter_engine.filter_image(image_data, "smooth", sigma, job)
 
-    def apply_smoothing_filter(self, viewer, reader, sigma=1.0):
         smoothing_filter = vtk.vtkImageGaussianSmooth()
-        smoothing_filter.SetInputConnection(reader.GetOutputPort())
+        smoothing_filter.SetInputData(image_data)
         smoothing_filter.SetStandardDeviation(sigma)
-        smoothing_filter.Update()
 
-        # Apply the smoothed output back to the viewer
-        viewer.SetInputConnection(smoothing_filter.GetOutputPort())
+        # Return the smoothed volume
+        return self.filtered_output(smoothing_filter, job, extent)
 
 
-    def apply_noise_reduction_filter(self, viewer, reader, kernel_size=3):
+    def apply_noise_reduction_filter(self, image_data, kernel_size=3, job=None, extent=None):
         """
     Applies a median filter for noise reduction.
     
     Args:
-        viewer: The VTK viewer to render the output.
-        reader: The VTK DICOM reader providing the input image.
+        image_data: The vtkImageData volume to filter.
         kernel_size: Size of the kernel for the median filter (default is 3).
+        job: Optional FilterJob receiving progress and able to cancel the run.
+        extent: Optional VTK extent; only that part of the output is computed.
+
+    Returns:
+        The filtered vtkImageData.
     """
+        # Whole volumes are split into z-slabs filtered on every core
+        if extent is None and slab_filter_engine.parallel:
+            return slab_filter_engine.filter_image(image_data, "denoise", kernel_size, job)
+
     # Create the median filter
         median_filter = vtk.vtkImageMedian3D()
-        median_filter.SetInputConnection(reader.GetOutputPort())
+        median_filter.SetInputData(image_data)
         
         # Set the kernel size (applies to X, Y, Z dimensions)
         median_filter.SetKernelSize(kernel_size, kernel_size, kernel_size)
-        median_filter.Update()
 
-        # Apply the filtered output to the viewer
-        viewer.SetInputConnection(median_filter.GetOutputPort())
+        # Return the filtered volume
+        return self.filtered_output(median_filter, job, extent)
         
     
+class MainThreadDispatcher(QObject):
+    # Runs callables posted from worker threads on the Qt event loop
+    _call = pyqtSignal(object)
+
+    def __init__(self):
+        super(MainThreadDispatcher, self).__init__()
+        self._call.connect(lambda fn: fn())
+
+    def post(self, fn, *args):
+        self._call.emit(lambda: fn(*args))
+
+
 class MyWindow(QMainWindow):
     def __init__(self):
         super(MyWindow, self).__init__()
@@ -212,6 +464,20 @@ class MyWindow(QMainWindow):
         self.renderer = vtk.vtkRenderer()
         self.vtk_widget.GetRenderWindow().AddRenderer(self.renderer)
         self.vtk_widget.Initialize()
+
+        # Swap in light meshes while the camera moves and the full mesh once it stops
+        interactor = self.vtk_widget.GetRenderWindow().GetInteractor()
+        interactor.AddObserver("StartInteractionEvent", lambda obj, event: self.set_interactive(True))
+        interactor.AddObserver("EndInteractionEvent", lambda obj, event: self.set_interactive(False))
+
+        # The CPU ray caster trades rays for speed to hold this frame rate while the camera moves
+        interactor.SetDesiredUpdateRate(DEFAULT_INTERACTIVE_FPS)
+
+        # Every 3D frame is timed, split by interaction, for the frame rate shown in the status bar
+        self.frame_start = 0
+        render_window = self.vtk_widget.GetRenderWindow()
+        render_window.AddObserver("StartEvent", self.on_frame_start)
+        render_window.AddObserver("EndEvent", self.on_frame_end)
         
         self.vtk_layout.addWidget(self.vtk_widget)
 
@@ -230,14 +496,48 @@ class MyWindow(QMainWindow):
         self.ui.iso_slider.setRange(0, 1000)
         self.ui.iso_slider.setValue(100)
         self.ui.iso_slider.valueChanged.connect(self.update_isovalue_label)
+        self.ui.iso_slider.sliderReleased.connect(lambda: self.scheduler.request("3d", "refine", self.refine_surface))
+
+        # Every control goes through the scheduler: at most one render per view per display frame
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen else 60.0
+        self.scheduler = RenderScheduler(1000.0 / max(refresh_rate, 1.0), self)
+        self.scheduler.set_renderer("3d", self.render_3d)
+        for i, view in enumerate(VIEWS[1:]):
+            self.scheduler.set_renderer(view, lambda idx=i: self.render_slice(idx))
+
+        # Surfaces for nearby isovalues are precomputed once the slider has been idle for a moment
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(300)
+        self.prefetch_timer.timeout.connect(self.prefetch_surfaces)
 
         # Add shortcut for loading files
         QShortcut(QKeySequence("Ctrl+o"), self).activated.connect(self.select_folder)
+
+        # Archives: index a directory tree once, then open series by UID from the index
+        QShortcut(QKeySequence("Ctrl+i"), self).activated.connect(self.index_folder)
+        QShortcut(QKeySequence("Ctrl+Shift+o"), self).activated.connect(lambda: self.choose_series())
+
+        # Region of interest: Ctrl+R shows a box in the 3D view and crops to it when pressed again
+        QShortcut(QKeySequence("Ctrl+r"), self).activated.connect(self.toggle_roi_box)
+        QShortcut(QKeySequence("Ctrl+Shift+r"), self).activated.connect(lambda: self.set_roi(None))
+
+        # Ctrl+M shows what the caches hold, by series, stage and dtype
+        QShortcut(QKeySequence("Ctrl+m"), self).activated.connect(self.show_memory_report)
+        self.roi_widget = None
         
         self.vtk_widgets = [self.ui.axial_widget, self.ui.coronal_widget, self.ui.sagittal_widget]
+        for widget in self.vtk_widgets:
+            widget.setAlignment(Qt.AlignCenter)  # Slices keep their aspect ratio, so center them
         self.sliders = [self.ui.axial_vSlider, self.ui.coronal_vSlider, self.ui.sagittal_vSlider]
 
+        # Connect each slice slider to the scheduler once
+        for i, slider in enumerate(self.sliders):
+            slider.valueChanged.connect(lambda value, idx=i: self.schedule_slice(value, idx))
+
         self.selected_folder = None
+        self.series_source = {}  # files= and series_uid= of a series opened from the study index
         self.viewers = None
         
         
@@ -249,6 +549,10 @@ class MyWindow(QMainWindow):
         self.ui.sharpen_slider.valueChanged.connect(lambda val: self.update_filter_intensity("sharpen", val))
         self.ui.smoothing_slider.valueChanged.connect(lambda val: self.update_filter_intensity("smooth", val))
         self.ui.noise_reduction_slider.valueChanged.connect(lambda val: self.update_filter_intensity("denoise", val))
+        self.sharpen_intensity = self.ui.sharpen_slider.value() / 10.0
+        self.smooth_sigma = self.ui.smoothing_slider.value() / 10.0
+        self.denoise_kernel = int(self.ui.noise_reduction_slider.value())
+        self.filter_settings = {}
         
         self.visualizer = Visualizer(
             folder=self.selected_folder,
@@ -261,29 +565,86 @@ class MyWindow(QMainWindow):
             color=(0.0, 0.0, 1.0),
         )
         
-        self.ui.ambient_input.valueChanged.connect(lambda: self.visualize(in_place=True))
-        self.ui.diffuse_input.valueChanged.connect(lambda: self.visualize(in_place=True))
-        self.ui.specular_input.valueChanged.connect(lambda: self.visualize(in_place=True))
-        self.ui.specular_power_input.valueChanged.connect(lambda: self.visualize(in_place=True))
+        self.ui.ambient_input.valueChanged.connect(self.update_lighting)
+        self.ui.diffuse_input.valueChanged.connect(self.update_lighting)
+        self.ui.specular_input.valueChanged.connect(self.update_lighting)
+        self.ui.specular_power_input.valueChanged.connect(self.update_lighting)
         
         
         self.ui.window_width_slider.valueChanged.connect(self.update_window_width)
         self.ui.window_level_slider.valueChanged.connect(self.update_window_level)
 
+        # Progress and cancel live in the status bar while a series decodes or a filter runs
+        self.dispatcher = MainThreadDispatcher()
+        self.task_progress = QProgressBar()
+        self.task_progress.setMaximumWidth(240)
+        self.task_cancel_btn = QPushButton("Cancel")
+        self.task_cancel_btn.clicked.connect(self.cancel_tasks)
+        self.ui.statusbar.addPermanentWidget(self.task_progress)
+        self.ui.statusbar.addPermanentWidget(self.task_cancel_btn)
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+        self.load_cancel = None
+        self.filter_job = None
+
+        # Rolling p50/p95 of the main stages, refreshed in the status bar once a second
+        self.timing_label = QLabel()
+        self.ui.statusbar.addPermanentWidget(self.timing_label)
+        self.timing_timer = QTimer(self)
+        self.timing_timer.timeout.connect(self.update_timing_label)
+        self.timing_timer.start(1000)
+        self.preview_jobs = {}
+        self.preview_chain = None
+        self.refine_timer = QElapsedTimer()
+
     
+    def on_frame_start(self, obj, event):
+        self.frame_start = time.perf_counter_ns()
+
+    def on_frame_end(self, obj, event):
+        name = "render.interactive" if self.visualizer.interactive else "render.still"
+        instrumentation.record(name, self.frame_start, time.perf_counter_ns(), {"mode": self.visualizer.render_mode})
+
+    def update_timing_label(self):
+        text = instrumentation.status_text({
+            "load.read": "load",
+            "filter.preview": "preview",
+            "isosurface.extract": "surface",
+            "render.3d": "3D",
+            "slice.render": "slice",
+            "slice.pixmap": "pixmap",
+            "frame": "frame",
+        })
+
+        # Achieved frame rate while rotating, against the target the CPU ray caster adapts to
+        figures = instrumentation.percentiles("render.interactive")
+        if figures is not None and figures[1] > 0:
+            text += f"  |  {self.visualizer.render_mode.upper()} {1000.0 / figures[1]:.1f} fps"
+            if self.visualizer.render_mode == "cpu":
+                text += f" (target {DEFAULT_INTERACTIVE_FPS:g})"
+        text += f"  |  mem {memory_manager.nbytes() / 2**20:.0f}/{memory_manager.budget_bytes / 2**20:.0f} MB"
+        self.timing_label.setText(text)
+
+    def show_memory_report(self):
+        QMessageBox.information(self, "Memory", memory_manager.report())
+
     def update_window_width(self, value):
         self.ui.window_width_lbl.setText(f"widnow width : {self.ui.window_width_slider.value()}")
-        for viewer in self.viewers:
-            viewer.SetColorWindow(value)
-            viewer.Render()
-            self.setup_mpr_viewers()
+        self.update_window()
 
     def update_window_level(self, value):
         self.ui.window_level_lbl.setText(f"widnow level : {self.ui.window_level_slider.value()}")
-        for viewer in self.viewers:
-            viewer.SetColorLevel(value)
-            viewer.Render()
-            self.setup_mpr_viewers()
+        self.update_window()
+
+    def update_window(self):
+        if not self.viewers:
+            return
+
+        # One LUT rebuild shared by the views, then only the three visible slices are remapped
+        window = self.ui.window_width_slider.value()
+        level = self.ui.window_level_slider.value()
+        for i, view in enumerate(VIEWS[1:]):
+            self.scheduler.request(view, "window", lambda idx=i: self.viewers[idx].set_window_level(window, level))
             
             
     def update_filter_intensity(self, filter_type, value):
@@ -296,80 +657,253 @@ class MyWindow(QMainWindow):
         elif filter_type == "denoise":
             self.ui.noise_size_lbl.setText(f"noise reducation filter size: {self.ui.noise_reduction_slider.value()}")
             self.denoise_kernel = int(value)
+        self.schedule_preview(filter_type)
+
+    def chain_with(self, filter_type):
+        # The applied chain with one stage set from its slider; a zero setting removes the stage
+        parameter = {
+            "denoise": self.denoise_kernel,
+            "smooth": self.smooth_sigma,
+            "sharpen": self.sharpen_intensity,
+        }[filter_type]
+        identity = {"denoise": 1, "smooth": 0, "sharpen": 0}[filter_type]
+        settings = dict(self.filter_settings)
+        if parameter > identity:
+            settings[filter_type] = parameter
+        else:
+            settings.pop(filter_type, None)
+        return settings
+
+    def schedule_preview(self, filter_type):
+        # A streaming volume is still changing under the filters, so they wait for it like ROIs do
+        if not self.viewers or not self.selected_folder or self.load_cancel is not None:
+            return
+
+        # Moving a filter slider previews the chain on the three visible slices only
+        chain = FilterChain(self.chain_with(filter_type).items())
+        if chain == self.visualizer.filter_chain:
+            self.clear_previews()
+            return
+        self.preview_chain = chain
+        for i, viewer in enumerate(self.viewers):
+            self.preview_view(i, viewer.slice)
+
+    def preview_view(self, idx, index):
+        # One job per view, so scrolling one view does not cancel the others' previews
+        job = self.preview_jobs.pop(idx, None)
+        if job is not None:
+            job.cancel()
+
+        visualizer, chain, axis = self.visualizer, self.preview_chain, self.viewers[idx].axis
+        self.preview_jobs[idx] = filter_runner.submit(
+            lambda job: visualizer.preview_filter_chain(chain, axis, index, job),
+            on_done=lambda job, plane: self.dispatcher.post(self.on_preview_done, job, idx, index, plane),
+        )
+
+    def on_preview_done(self, job, idx, index, plane):
+        if self.preview_jobs.get(idx) is not job:
+            return
+        del self.preview_jobs[idx]
+        if plane is not None:
+            self.viewers[idx].set_preview(plane, index)
+            self.scheduler.request(VIEWS[idx + 1])
+
+    def clear_previews(self):
+        self.preview_chain = None
+        for job in self.preview_jobs.values():
+            job.cancel()
+        self.preview_jobs = {}
+        for i, viewer in enumerate(self.viewers or []):
+            if viewer.preview is not None:
+                viewer.clear_preview()
+                self.scheduler.request(VIEWS[i + 1])
 
     def apply_filter(self, filter_type):
         if not self.viewers or not self.selected_folder:
             return
+        if self.load_cancel is not None:
+            self.ui.statusbar.showMessage("Filters apply once the series has finished loading")
+            return
 
-        # Initialize the reader for the current folder
-        reader = vtk.vtkDICOMImageReader()
-        reader.SetDirectoryName(self.selected_folder)
-        reader.Update()
+        # The button adds its stage to the chain (a zero setting removes it); stages always
+        # run denoise -> smooth -> sharpen from the loaded volume
+        self.filter_settings = self.chain_with(filter_type)
+        self.run_filter_chain()
+
+    def run_filter_chain(self):
+        chain = FilterChain(self.filter_settings.items())
+
+        # Filter on the worker pool; the views keep showing the current volume (or its
+        # slice previews) until the result is ready
+        self.cancel_filter()
+        self.preview_chain = None
+        visualizer = self.visualizer
+        self.filter_job = filter_runner.submit(
+            lambda job: visualizer.apply_filter_chain(chain, job),
+            on_progress=lambda job, fraction: self.dispatcher.post(self.on_filter_progress, job, fraction),
+            on_done=lambda job, filtered: self.dispatcher.post(self.on_filter_done, job, visualizer, chain, filtered),
+        )
+        self.task_progress.setRange(0, 100)
+        self.task_progress.setValue(0)
+        self.task_progress.show()
+        self.task_cancel_btn.show()
+        self.ui.statusbar.showMessage(f"Applying filters: {' -> '.join(name for name, _ in chain.stages) or 'none'}")
 
-        # Use the existing Visualizer instance to apply the filter
+    def on_filter_progress(self, job, fraction):
+        if job is self.filter_job:
+            self.task_progress.setValue(int(fraction * 100))
+
+    def on_filter_done(self, job, visualizer, chain, filtered):
+        if job is not self.filter_job:
+            return
+
+        self.filter_job = None
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+        self.clear_previews()
+        if filtered is None or visualizer is not self.visualizer:
+            self.ui.statusbar.showMessage(f"Filter failed: {job.error}" if job.error else "Filter cancelled")
+            return
+
+        # Swap the filtered volume into all three views at once; they redraw on the same frame
+        visualizer.set_filtered(chain, filtered)
+        array = image_to_array(filtered)
         for i, viewer in enumerate(self.viewers):
-            if filter_type == "sharpen":
-                self.visualizer.apply_sharpening_filter(viewer, reader, self.sharpen_intensity)
-            elif filter_type == "smooth":
-                self.visualizer.apply_smoothing_filter(viewer, reader, self.smooth_sigma)
-            elif filter_type == "denoise":
-                self.visualizer.apply_noise_reduction_filter(viewer, reader, self.denoise_kernel)
-
-            # Re-render the updated viewer
-            viewer.Render()
-            self.update_slice(viewer.GetSlice(), i)  # Update QLabel with new image
-        
-        
-        
+            viewer.set_volume(array)
+            self.scheduler.request(VIEWS[i + 1])
+
+        # The 3D view ray casts or contours the filtered volume too
+        self.render_volume(in_place=True)
+        self.update_isovalue_range()
+        self.ui.statusbar.showMessage("Filter applied")
+
+    def cancel_filter(self):
+        if self.filter_job is None:
+            return
+
+        # The worker aborts the VTK filter at its next progress event and drops the partial output
+        self.filter_job.cancel()
+        self.filter_job = None
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+
+    def cancel_tasks(self):
+        if self.filter_job is not None:
+            self.cancel_filter()
+            self.clear_previews()
+            self.ui.statusbar.showMessage("Filter cancelled")
+        self.cancel_load()
+
+    def toggle_roi_box(self):
+        if not self.selected_folder or self.load_cancel is not None:
+            return
+        if self.roi_widget is not None:
+            # Second press: crop to the box as the user left it
+            bounds = self.roi_widget.GetRepresentation().GetBounds()
+            self.hide_roi_box()
+            roi = ROI.from_bounds(self.visualizer.source_data, bounds)
+            if roi is None:
+                self.ui.statusbar.showMessage("The box does not cover the volume")
+                return
+            self.set_roi(roi)
+            return
+
+        # The box starts on the current ROI (or the whole volume); rotation would leave the voxel grid
+        source, roi = self.visualizer.source_data, self.visualizer.roi
+        representation = vtk.vtkBoxRepresentation()
+        representation.SetPlaceFactor(1.0)
+        representation.PlaceWidget(roi.bounds(source) if roi is not None else source.GetBounds())
+        self.roi_widget = vtk.vtkBoxWidget2()
+        self.roi_widget.SetInteractor(self.vtk_widget.GetRenderWindow().GetInteractor())
+        self.roi_widget.SetRepresentation(representation)
+        self.roi_widget.SetCurrentRenderer(self.vtk_widget.GetRenderWindow().GetRenderers().GetFirstRenderer())
+        self.roi_widget.RotationEnabledOff()
+        self.roi_widget.On()
+        self.scheduler.request("3d")
+        self.ui.statusbar.showMessage("Drag the box faces, then press Ctrl+R to crop to the box")
+
+    def hide_roi_box(self):
+        if self.roi_widget is not None:
+            self.roi_widget.Off()
+            self.roi_widget = None
+            self.scheduler.request("3d")
+
+    def set_roi(self, roi):
+        if not self.selected_folder or self.load_cancel is not None:
+            return
+        self.hide_roi_box()
+        if roi == self.visualizer.roi:
+            return
+
+        # Everything downstream now works on the crop: the views, the 3D view and the filters
+        self.cancel_filter()
+        self.clear_previews()
+        self.visualizer.set_roi(roi)
+        self.viewers = self.visualizer.get_mpr_viewers()
+        self.setup_mpr_viewers()
+        self.render_volume(in_place=True)
+        self.update_isovalue_range()
+        if self.filter_settings:
+            self.run_filter_chain()
+
+        if self.visualizer.roi is None:
+            self.ui.statusbar.showMessage("ROI cleared")
+        else:
+            shape = self.visualizer.roi.shape()
+            fraction = np.prod(shape) / np.prod(image_to_array(self.visualizer.source_data).shape)
+            self.ui.statusbar.showMessage(
+                f"ROI {shape[2]} x {shape[1]} x {shape[0]} voxels ({fraction:.0%} of the volume); Ctrl+Shift+R clears it"
+            )
+
     def setup_mpr_viewers(self):
         if not self.viewers:
             return
 
-        for i, widget in enumerate(self.vtk_widgets):
-            self.viewers[i].SetupInteractor(None)  # Disable interactor
-            self.viewers[i].SetColorWindow(self.ui.window_width_slider.value())  # Set initial window width
-            self.viewers[i].SetColorLevel(self.ui.window_level_slider.value()) 
-            self.viewers[i].Render()
+        # The views share one LUT, so setting window/level once covers all three
+        self.viewers[0].set_window_level(self.ui.window_width_slider.value(), self.ui.window_level_slider.value())
 
+        for i, widget in enumerate(self.vtk_widgets):
             # Set the slice to the middle
-            max_slices = self.viewers[i].GetSliceMax()
-            self.viewers[i].SetSlice(max_slices // 2)
+            max_slices = self.viewers[i].slice_max()
+            self.viewers[i].set_slice(max_slices // 2)
 
-            # Configure the slider with the slice range
+            # Configure the slider with the slice range without triggering a render per step
+            self.sliders[i].blockSignals(True)
             self.sliders[i].setMinimum(0)
             self.sliders[i].setMaximum(max_slices)
             self.sliders[i].setValue(max_slices // 2)
-
-            # Connect slider to the update_slice function
-            self.sliders[i].valueChanged.connect(lambda value, idx=i: self.update_slice(value, idx))
+            self.sliders[i].blockSignals(False)
 
             # Update the QLabel with the image initially
             self.update_slice(max_slices // 2, i)
             
             
             
-    def update_slice(self, value, idx):
-        self.viewers[idx].SetSlice(value)
-        self.viewers[idx].Render()
+    def schedule_slice(self, value, idx):
+        # Only the latest slider value of a frame is drawn
+        if self.viewers:
+            self.scheduler.request(VIEWS[idx + 1], "slice", lambda: self.viewers[idx].set_slice(value))
+            if self.preview_chain is not None:
+                self.preview_view(idx, value)
 
-        # Capture the rendered image
-        w2if = vtk.vtkWindowToImageFilter()
-        w2if.SetInput(self.viewers[idx].GetRenderWindow())
-        w2if.Update()
+    def update_slice(self, value, idx):
+        if not self.viewers:
+            return
+        self.viewers[idx].set_slice(value)
+        self.render_slice(idx)
 
-        # Convert to QImage
-        vtk_image = w2if.GetOutput()
-        width, height, _ = vtk_image.GetDimensions()
-        vtk_array = vtk.util.numpy_support.vtk_to_numpy(vtk_image.GetPointData().GetScalars())
-        vtk_array = vtk_array.reshape(height, width, 3)
+    def render_slice(self, idx):
+        if not self.viewers:
+            return
 
-        # Convert to QImage (RGB)
-        image = QImage(vtk_array.data, width, height, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(image)
-        resized_pixmap = pixmap.scaled(self.ui.sagittal_widget.size())
+        # Window/level the slice straight from the voxel array into the view's display buffer
+        size = self.vtk_widgets[idx].size()
+        with span("slice.render", view=VIEWS[idx + 1]):
+            image = self.viewers[idx].render(size.width(), size.height())
 
         # Set the pixmap on the QLabel
-        self.vtk_widgets[idx].setPixmap(resized_pixmap)
+        with span("slice.pixmap", view=VIEWS[idx + 1]):
+            self.vtk_widgets[idx].setPixmap(QPixmap.fromImage(image))
   
   
   
@@ -380,75 +914,401 @@ class MyWindow(QMainWindow):
             folder_name = os.path.basename(self.selected_folder)
             # self.selected_folder_label.setText(folder_name)
             # self.visualize_button.setEnabled(True)
-            self.visualize()
-            
-            
-    def visualize(self, in_place=False):
-        if self.selected_folder:
-            # Get the current values of the inputs
-            current_mode = "raycast" if self.ui.ray_btn.isChecked() else "surface"
-            current_ambient = self.ui.ambient_input.value()
-            current_diffuse = self.ui.diffuse_input.value()
-            current_specular = self.ui.specular_input.value()
-            current_specular_power = self.ui.specular_input.value()
-            current_isovalue = self.ui.iso_slider.value()
-
-            # Create a visualizer object
-            visualizer = Visualizer(
-                folder=self.selected_folder,
-                mode=current_mode,
-                ambient=current_ambient,
-                diffuse=current_diffuse,
-                specular=current_specular,
-                specular_power=current_specular_power,
-                isovalue=current_isovalue,
-                color=(0.0, 0.0, 1.0),
+            self.series_source = {}
+            self.load_series(self.selected_folder)
+
+    def index_folder(self):
+        root = QFileDialog.getExistingDirectory(self, "Index Folder")
+        if root:
+            self.ui.statusbar.showMessage(f"Indexing {root}...")
+            threading.Thread(target=self.run_index, args=(root,), daemon=True).start()
+
+    def run_index(self, root):
+        # Runs on a worker thread; only new or changed files have their headers parsed
+        try:
+            stats = study_index.scan(
+                root, progress=lambda done, total: self.dispatcher.post(self.on_index_progress, done, total)
             )
+        except (OSError, sqlite3.Error) as error:
+            self.dispatcher.post(self.ui.statusbar.showMessage, f"Indexing failed: {error}")
+            return
+        self.dispatcher.post(self.on_index_done, root, stats)
 
-            # Get the current renderer
-            render_window = self.vtk_widget.GetRenderWindow()
-            current_renderer = render_window.GetRenderers().GetFirstRenderer()
+    def on_index_progress(self, done, total):
+        self.ui.statusbar.showMessage(f"Indexing: {done} of {total} headers read")
+
+    def on_index_done(self, root, stats):
+        self.ui.statusbar.showMessage(
+            f"Indexed {stats['files']} files: {stats['parsed']} read, {stats['removed']} removed, "
+            f"{stats['series']} series updated"
+        )
+        self.choose_series(root)
+
+    def choose_series(self, root=None):
+        try:
+            series = study_index.list_series(root)
+        except (OSError, sqlite3.Error) as error:
+            self.ui.statusbar.showMessage(f"Could not open the study index: {error}")
+            return
+        if not series:
+            self.ui.statusbar.showMessage("No indexed series; index a folder with Ctrl+I")
+            return
 
-            # Store the current camera settings
-            if current_renderer:
-                camera = current_renderer.GetActiveCamera()
-                position = camera.GetPosition()
-                focal_point = camera.GetFocalPoint()
-                view_up = camera.GetViewUp()
+        labels = [
+            f"{i + 1}. {s['patient_name']} | {s['study_date']} | {s['modality']} "
+            f"{s['description'] or s['series_uid']} ({s['instances']} images)"
+            for i, s in enumerate(series)
+        ]
+        label, ok = QInputDialog.getItem(self, "Open Series", "Series:", labels, 0, False)
+        if ok:
+            self.open_series(series[labels.index(label)]["series_uid"])
 
-            # Clear old data
-            render_window.GetRenderers().RemoveAllItems()
+    def open_series(self, series_uid):
+        # The index already knows the series' files and order, so nothing is scanned but its own headers
+        try:
+            files = study_index.series_files(series_uid)
+        except (OSError, sqlite3.Error) as error:
+            self.ui.statusbar.showMessage(f"Could not open the study index: {error}")
+            return
+        if not files:
+            self.ui.statusbar.showMessage(f"Series {series_uid} is not in the index")
+            return
 
-            # Render the new data
-            renderer = visualizer.render()
+        # Files moved or deleted since the last scan are dropped; the index itself is fixed by re-indexing
+        present = [path for path in files if os.path.isfile(path)]
+        if not present:
+            self.ui.statusbar.showMessage(f"The index is stale: no files of series {series_uid} are left; re-index its folder")
+            return
+        if len(present) < len(files):
+            self.ui.statusbar.showMessage(
+                f"The index is stale: {len(files) - len(present)} files of the series are missing; re-index its folder"
+            )
+            files = present
+        self.selected_folder = os.path.dirname(files[0])
+        self.series_source = {"files": files, "series_uid": series_uid}
+        self.load_series(self.selected_folder, **self.series_source)
 
-            # Apply the stored camera settings to the new renderer if update in place is enabled
-            if current_renderer and in_place:
-                new_camera = renderer.GetActiveCamera()
-                new_camera.SetPosition(position)
-                new_camera.SetFocalPoint(focal_point)
-                new_camera.SetViewUp(view_up)
+    def load_series(self, folder, files=None, series_uid=None):
+        self.cancel_filter()
+        self.clear_previews()
+        self.cancel_load()
 
-            # Set the background color and add the new renderer
-            
-            render_window.AddRenderer(renderer)
+        # Series in memory or in the disk store open synchronously; anything else streams in
+        try:
+            key = volume_cache.key_for(folder) if files is None else volume_cache.key_for_series(series_uid, files)
+        except OSError as error:
+            self.on_load_failed(f"Could not read the series: {error}")
+            return
+        if volume_cache.contains(key) or volume_store.contains(*key):
+            self.visualize()
+            return
+
+        cancel = threading.Event()
+        self.load_cancel = cancel
+        threading.Thread(
+            target=self.stream_series, args=(folder, key, cancel, files, series_uid), daemon=True
+        ).start()
+
+    def stream_series(self, folder, key, cancel, files=None, series_uid=None):
+        # Runs on a worker thread; every GUI update is posted back to the event loop
+        try:
+            layout = scan_series(folder, files, series_uid)
+        except SeriesLoadError:
+            self.dispatcher.post(self.on_load_fallback, key, cancel)
+            return
+
+        # Any other failure (an unreadable or vanished file, an unsupported transfer syntax)
+        # must still release the load, or the controls that wait for it stay blocked
+        try:
+            array = np.full(layout.shape, fill_value(layout), dtype=layout.dtype)
+            volume = SeriesVolume(array, layout.spacing, layout.origin, layout.direction, layout.series_uid)
+            self.dispatcher.post(self.on_load_started, volume, cancel)
+
+            # The histogram is counted slice by slice as they land, so the volume is never scanned twice
+            done, stats = 0, VolumeStats.for_dtype(layout.dtype)
+            with span("load.stream", folder=folder, slices=len(layout.files)):
+                for index in stream_series(layout, array, cancel=cancel, stats=stats):
+                    done += 1
+                    self.dispatcher.post(self.on_slice_loaded, index, done, cancel)
+            volume.stats = stats.trimmed()
+        except Exception as error:
+            self.dispatcher.post(self.on_load_fallback, key, cancel, error)
+            return
+        self.dispatcher.post(self.on_load_finished, key, volume.stats, done, len(layout.files), cancel)
+
+        # Persist the assembled volume off the GUI thread so the next open maps it from disk
+        if done == len(layout.files):
+            try:
+                volume_store.save(*key, volume)
+            except OSError:
+                # The volume is already in memory; it is just decoded again next time
+                pass
+
+    def on_load_fallback(self, key, cancel, error=None):
+        # pydicom could not place or decode the slices; read the folder synchronously with VTK's
+        # reader rather than through the cache, which would run the same pydicom decode again
+        if cancel is not self.load_cancel:
+            return
+        self.load_cancel = None
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+        if self.series_source:
+            # Indexed series have no folder of their own for the VTK reader to fall back on
+            self.on_load_failed("Could not load the series" + (f": {error}" if error is not None else ""))
+            return
+        try:
+            volume = read_folder_volume(self.selected_folder)
+        except SeriesLoadError as fallback_error:
+            self.on_load_failed(f"Could not load the series: {error if error is not None else fallback_error}")
+            return
+        volume_cache.put(key, to_vtk_image(volume))
+        self.visualize()
+
+    def on_load_failed(self, message):
+        # Nothing usable was loaded; drop the half-open series so no control acts on it
+        self.selected_folder = None
+        self.series_source = {}
+        self.viewers = None
+        self.hide_roi_box()
+        self.vtk_widget.GetRenderWindow().GetRenderers().RemoveAllItems()
+        for widget in self.vtk_widgets:
+            widget.clear()
+        self.ui.statusbar.showMessage(message)
+
+    def on_load_started(self, volume, cancel):
+        if cancel is not self.load_cancel:
+            return
+
+        # Show the empty volume straight away; slices fill it in place as they are decoded
+        self.visualizer = self.create_visualizer(image_data=to_vtk_image(volume))
+        self.filter_settings = {}
+        self.hide_roi_box()
+        self.viewers = self.visualizer.get_mpr_viewers()
+        self.setup_mpr_viewers()
+
+        total = volume.array.shape[0]
+        self.task_progress.setRange(0, total)
+        self.task_progress.setValue(0)
+        self.task_progress.show()
+        self.task_cancel_btn.show()
+        self.next_volume_refine = max(total // 4, 1)
+        self.refine_timer.start()
+
+    def on_slice_loaded(self, index, done, cancel):
+        if cancel is not self.load_cancel:
+            return
+
+        self.task_progress.setValue(done)
+        self.visualizer.source_data.Modified()
+
+        # The axial view repaints as soon as its slice lands; the others refine a few times a second
+        if index == self.viewers[0].slice:
+            self.scheduler.request("axial")
+        if self.refine_timer.elapsed() > 250:
+            self.scheduler.request("coronal")
+            self.scheduler.request("sagittal")
+            self.refine_timer.restart()
+        if done >= self.next_volume_refine:
+            self.render_volume(in_place=True)
+            self.next_volume_refine += max(self.task_progress.maximum() // 4, 1)
+
+    def on_load_finished(self, key, stats, done, total, cancel):
+        if cancel is not self.load_cancel:
+            return
+
+        self.load_cancel = None
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+        if done < total:
+            return
+
+        attach_stats(self.visualizer.source_data, stats)
+        volume_cache.put(key, self.visualizer.source_data)
+        self.visualizer.series_key = key
+        self.visualizer.source_key = key
+        self.apply_volume_stats()
+        for i, viewer in enumerate(self.viewers):
+            self.update_slice(viewer.slice, i)
+        self.render_volume(in_place=True)
+
+    def cancel_load(self):
+        if self.load_cancel is None:
+            return
+
+        # Stale callbacks from the cancelled worker are ignored; the partial volume is not cached
+        self.load_cancel.set()
+        self.load_cancel = None
+        self.task_progress.hide()
+        self.task_cancel_btn.hide()
+        self.ui.statusbar.showMessage("Load cancelled")
+
+    def create_visualizer(self, image_data=None, series_key=None):
+        # Get the current values of the inputs
+        current_mode = "raycast" if self.ui.ray_btn.isChecked() else "surface"
+        current_ambient = self.ui.ambient_input.value()
+        current_diffuse = self.ui.diffuse_input.value()
+        current_specular = self.ui.specular_input.value()
+        current_specular_power = self.ui.specular_power_input.value()
+        current_isovalue = self.ui.iso_slider.value()
+
+        # Create a visualizer object
+        return Visualizer(
+            folder=self.selected_folder,
+            mode=current_mode,
+            ambient=current_ambient,
+            diffuse=current_diffuse,
+            specular=current_specular,
+            specular_power=current_specular_power,
+            isovalue=current_isovalue,
+            color=(0.0, 0.0, 1.0),
+            image_data=image_data,
+            series_key=series_key,
+        )
+
+    def render_volume(self, in_place=False):
+        # Get the current renderer
+        render_window = self.vtk_widget.GetRenderWindow()
+        current_renderer = render_window.GetRenderers().GetFirstRenderer()
+
+        # Store the current camera settings
+        if current_renderer:
+            camera = current_renderer.GetActiveCamera()
+            position = camera.GetPosition()
+            focal_point = camera.GetFocalPoint()
+            view_up = camera.GetViewUp()
+
+        # Clear old data
+        render_window.GetRenderers().RemoveAllItems()
+
+        # Render the new data
+        with span("render.build", mode=self.visualizer.mode):
+            renderer = self.visualizer.render()
+
+        # Apply the stored camera settings to the new renderer if update in place is enabled
+        if current_renderer and in_place:
+            new_camera = renderer.GetActiveCamera()
+            new_camera.SetPosition(position)
+            new_camera.SetFocalPoint(focal_point)
+            new_camera.SetViewUp(view_up)
+
+        # Set the background color and add the new renderer
+        
+        render_window.AddRenderer(renderer)
+        if self.roi_widget is not None:
+            self.roi_widget.SetCurrentRenderer(renderer)
+        with span("render.3d", first=True):
             render_window.Render()
-            
-            self.viewers = visualizer.get_mpr_viewers()
+
+    def visualize(self, in_place=False):
+        if self.selected_folder:
+            # While a series is still streaming in, keep working on the partially filled volume
+            image_data, series_key = None, None
+            try:
+                if self.load_cancel is not None:
+                    image_data = self.visualizer.source_data
+                elif self.series_source:
+                    series_key = volume_cache.key_for_series(self.series_source["series_uid"], self.series_source["files"])
+                    image_data = volume_cache.fetch(series_key, **self.series_source)
+                self.visualizer = self.create_visualizer(image_data, series_key)
+            except (SeriesLoadError, OSError) as error:
+                self.on_load_failed(f"Could not load the series: {error}")
+                return
+            self.filter_settings = {}
+            self.hide_roi_box()
+            self.render_volume(in_place)
+
+            self.viewers = self.visualizer.get_mpr_viewers()
             self.setup_mpr_viewers()
+            self.apply_volume_stats()
+
+            stats = volume_cache.stats()
+            self.ui.statusbar.showMessage(
+                f"Volume cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['bytes'] / 2**20:.0f} MB of {stats['budget_bytes'] / 2**20:.0f} MB"
+            )
 
     def toggle_inputs(self):
         # Enable/disable inputs based on the selected rendering mode
         raycast_selected = self.ui.ray_btn.isChecked()
         self.ui.iso_slider.setEnabled(not raycast_selected)
+
+        # Both radio buttons emit toggled; only rebuild the 3D pipeline when the mode really changes
+        mode = "raycast" if raycast_selected else "surface"
+        if self.selected_folder and mode != self.visualizer.mode:
+            self.visualizer.mode = mode
+            self.render_volume(in_place=True)
+
+    def set_interactive(self, interactive):
+        self.visualizer.set_interactive(interactive)
+        if not interactive and self.selected_folder:
+            self.vtk_widget.GetRenderWindow().Render()
+
+    def render_3d(self):
         if self.selected_folder:
-            self.visualize()
+            with span("render.3d"):
+                self.vtk_widget.GetRenderWindow().Render()
+
+    def update_lighting(self):
+        lighting = (
+            self.ui.ambient_input.value(),
+            self.ui.diffuse_input.value(),
+            self.ui.specular_input.value(),
+            self.ui.specular_power_input.value(),
+        )
+        self.scheduler.request("3d", "lighting", lambda: self.visualizer.update_lighting(*lighting))
     
     def update_isovalue_label(self):
         # Update the isovalue label when the slider value changes
         self.ui.iso_val_lbl.setText(f"Isovalue: {self.ui.iso_slider.value()}")
+        value = self.ui.iso_slider.value()
+        if not self.selected_folder:
+            self.visualizer.isovalue = value
+            return
+        self.scheduler.request("3d", "isovalue", lambda: self.apply_isovalue(value))
+        self.prefetch_timer.start()
+
+    def apply_isovalue(self, value):
+        # Coarse proxy surface immediately; full resolution follows in the background once the drag ends
+        self.visualizer.set_isovalue(value, preview=True)
+        if not self.ui.iso_slider.isSliderDown():
+            self.refine_surface()
+
+    def refine_surface(self):
         if self.selected_folder:
-            self.visualize(in_place=True)
+            visualizer = self.visualizer
+            visualizer.refine_surface(
+                lambda isovalue, surface: self.dispatcher.post(self.on_surface_ready, visualizer, isovalue, surface)
+            )
+
+    def on_surface_ready(self, visualizer, isovalue, surface):
+        if visualizer is self.visualizer and visualizer.show_surface(isovalue, surface):
+            self.scheduler.request("3d")
+
+    def update_isovalue_range(self):
+        # The load-time histogram (or else the brick index) knows the scalar range, so the slider never covers empty values
+        stats = self.visualizer.stats
+        if stats is not None:
+            self.ui.iso_slider.setRange(stats.min, stats.max)
+            return
+        index = isosurface_service.brick_index(self.visualizer.series_key, self.visualizer.image_data)
+        if index is not None:
+            low, high = index.value_range()
+            self.ui.iso_slider.setRange(int(low), int(high))
+
+    def apply_volume_stats(self):
+        # Slider ranges follow the data and window/level starts on its 1st..99th percentiles
+        self.update_isovalue_range()
+        stats = self.visualizer.stats
+        if stats is None:
+            return
+        window, level = stats.auto_window_level()
+        self.ui.window_width_slider.setRange(1, max(stats.max - stats.min, 1))
+        self.ui.window_level_slider.setRange(stats.min, stats.max)
+        self.ui.window_width_slider.setValue(int(window))
+        self.ui.window_level_slider.setValue(int(level))
+
+    def prefetch_surfaces(self):
+        self.visualizer.prefetch_surfaces((self.ui.iso_slider.minimum(), self.ui.iso_slider.maximum()))
         
 
 def main():
@@ -0,0 +1,205 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from vtk.util import numpy_support
+
+
+# Memory every tracked volume and mesh may take together before derived data is evicted
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("DICOM_VIEWER_MEMORY_MB", "4096"))
+
+# Eviction order: cheapest to rebuild first; decoded series go last
+STAGES = ("surface_preview", "proxy", "surface", "filtered", "roi", "volume")
+
+
+def root_key(series_key):
+    """
+    The (folder or "series:<uid>", fingerprint) key a cache key derives from.
+
+    Derived keys nest the source key first (filter chains, ROIs, isovalues), so the
+    root is found by following the first element down.
+    """
+    key = series_key
+    while isinstance(key, tuple) and key and isinstance(key[0], tuple):
+        key = key[0]
+    return key
+
+
+def series_label(series_key):
+    # The series a cache key derives from: its folder, or "series:<uid>" for indexed series
+    key = root_key(series_key)
+    if isinstance(key, tuple) and key:
+        return str(key[0])
+    return "unknown" if key is None else str(key)
+
+
+def image_dtype(image):
+    scalars = image.GetPointData().GetScalars()
+    if scalars is None:
+        return "none"
+    return np.dtype(numpy_support.get_numpy_array_type(scalars.GetDataType())).name
+
+
+def mesh_dtype(mesh):
+    points = mesh.GetPoints()
+    if points is None:
+        return "none"
+    return np.dtype(numpy_support.get_numpy_array_type(points.GetDataType())).name
+
+
+def data_nbytes(data):
+    # GetActualMemorySize() reports kibibytes, for images and meshes alike
+    return data.GetActualMemorySize() * 1024
+
+
+class _Entry:
+    __slots__ = ("nbytes", "series", "stage", "dtype", "evict")
+
+    def __init__(self, nbytes, series, stage, dtype, evict):
+        self.nbytes = nbytes
+        self.series = series
+        self.stage = stage
+        self.dtype = dtype
+        self.evict = evict
+
+
+class MemoryManager:
+    """
+    Accounts for every volume and mesh the caches hold and enforces one global budget.
+
+    Each cache reports what it stores and drops under (owner, key). Once the total
+    passes the budget, entries are evicted by stage in STAGES order, least recently
+    used first within a stage, through the owner's evict callback: previews, proxies,
+    surfaces and filter outputs go long before any decoded series, and the most
+    recently used series volume is never evicted. Volumes stay in their native dtype
+    (int16 for CT), so the breakdown by dtype shows any promoted copy.
+
+    Callbacks run after the manager's lock is released, so owners may take their own
+    locks in them; they must not report back the entries they drop.
+
+    Args:
+        budget_bytes: Total memory the tracked entries may take.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def track(self, owner, key, data, stage, series_key=None, evict=None):
+        """
+        Records a volume (vtkImageData) or mesh (vtkPolyData) held by a cache.
+
+        Args:
+            owner: Name of the holding cache, e.g. "volumes".
+            key: The cache's key for the entry.
+            data: The vtkImageData or vtkPolyData.
+            stage: One of STAGES.
+            series_key: Key of the series the data derives from; defaults to key.
+            evict: Callable(key) that drops the entry from its cache, or None if it
+                cannot be evicted (it is released when the data is garbage collected).
+        """
+        dtype = image_dtype(data) if data.IsA("vtkImageData") else mesh_dtype(data)
+        entry = _Entry(data_nbytes(data), series_label(key if series_key is None else series_key), stage, dtype, evict)
+        if evict is None:
+            weakref.finalize(data, self._release_entry, owner, key, entry)
+        with self._lock:
+            self._entries[(owner, key)] = entry
+            self._entries.move_to_end((owner, key))
+            victims = self._select_victims()
+        self._evict(victims)
+
+    def touch(self, owner, key):
+        # Cache hits keep an entry at the back of the eviction queue
+        with self._lock:
+            if (owner, key) in self._entries:
+                self._entries.move_to_end((owner, key))
+
+    def release(self, owner, key):
+        # The owner dropped the entry on its own (its own budget, a clear, garbage collection)
+        with self._lock:
+            self._entries.pop((owner, key), None)
+
+    def _release_entry(self, owner, key, entry):
+        # A collected object only releases its own entry, not a newer one under the same key
+        with self._lock:
+            if self._entries.get((owner, key)) is entry:
+                del self._entries[(owner, key)]
+
+    def release_owner(self, owner):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == owner]:
+                del self._entries[entry_key]
+
+    def set_budget(self, budget_bytes):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            victims = self._select_victims()
+        self._evict(victims)
+
+    def nbytes(self):
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def _select_victims(self):
+        # Called with the lock held; removes the chosen entries and returns them
+        total = sum(entry.nbytes for entry in self._entries.values())
+        if total <= self.budget_bytes:
+            return []
+        newest_volume = next(
+            (k for k in reversed(self._entries) if self._entries[k].stage == "volume"), None
+        )
+        candidates = [
+            (STAGES.index(entry.stage), order, entry_key)
+            for order, (entry_key, entry) in enumerate(self._entries.items())
+            if entry.evict is not None and entry_key != newest_volume
+        ]
+        victims = []
+        for _, _, entry_key in sorted(candidates):
+            if total <= self.budget_bytes:
+                break
+            entry = self._entries.pop(entry_key)
+            total -= entry.nbytes
+            victims.append((entry_key, entry))
+        return victims
+
+    def _evict(self, victims):
+        for (owner, key), entry in victims:
+            self.evictions += 1
+            entry.evict(key)
+
+    def breakdown(self):
+        """
+        Live totals in bytes by series, by stage and by dtype, plus the overall figures.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        result = {"total": 0, "budget": self.budget_bytes, "entries": len(entries), "evictions": self.evictions,
+                  "series": {}, "stage": {}, "dtype": {}}
+        for entry in entries:
+            result["total"] += entry.nbytes
+            for group, name in (("series", entry.series), ("stage", entry.stage), ("dtype", entry.dtype)):
+                result[group][name] = result[group].get(name, 0) + entry.nbytes
+        return result
+
+    def report(self):
+        """
+        The breakdown as readable lines, largest first within each group.
+        """
+        figures = self.breakdown()
+        lines = [
+            f"Tracked: {figures['total'] / 2**20:.0f} MB of {figures['budget'] / 2**20:.0f} MB "
+            f"in {figures['entries']} entries ({figures['evictions']} evicted)"
+        ]
+        for group in ("series", "stage", "dtype"):
+            lines.append(f"By {group}:")
+            for name, nbytes in sorted(figures[group].items(), key=lambda item: -item[1]):
+                lines.append(f"  {name}: {nbytes / 2**20:.1f} MB")
+        return "\n".join(lines)
+
+
+# Shared instance used across the application
+memory_manager = MemoryManager()
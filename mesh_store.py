@@ -0,0 +1,140 @@
+import hashlib
+import os
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from disk_store import DEFAULT_CACHE_DIR, DiskStore
+from memory import root_key
+
+
+DEFAULT_MESH_STORE_MB = int(os.environ.get("DICOM_VIEWER_MESH_STORE_MB", "2048"))
+
+# Arrays of one entry, each a raw .npy file next to the JSON header
+ARRAYS = ("points", "normals", "offsets", "connectivity")
+
+
+def mesh_arrays(surface):
+    """
+    Flattens a triangle mesh into float32 points and normals and int32 cell offsets and
+    connectivity. Returns None for meshes holding anything but polygons.
+    """
+    if surface.GetNumberOfVerts() or surface.GetNumberOfLines() or surface.GetNumberOfStrips():
+        return None
+    points = surface.GetPoints()
+    polys = surface.GetPolys()
+    normals = surface.GetPointData().GetNormals()
+    return {
+        "points": (
+            numpy_support.vtk_to_numpy(points.GetData()).astype(np.float32, copy=False)
+            if points is not None else np.zeros((0, 3), dtype=np.float32)
+        ),
+        "normals": numpy_support.vtk_to_numpy(normals).astype(np.float32, copy=False) if normals is not None else None,
+        "offsets": numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(np.int32),
+        "connectivity": numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int32),
+    }
+
+
+def mesh_from_arrays(arrays):
+    """
+    Builds a vtkPolyData over the arrays without copying them, e.g. straight from memory maps.
+    """
+    surface = vtk.vtkPolyData()
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(arrays["points"], deep=False))
+    surface.SetPoints(points)
+
+    polys = vtk.vtkCellArray()
+    polys.SetData(
+        numpy_support.numpy_to_vtk(arrays["offsets"], deep=False),
+        numpy_support.numpy_to_vtk(arrays["connectivity"], deep=False),
+    )
+    surface.SetPolys(polys)
+
+    if arrays.get("normals") is not None:
+        normals = numpy_support.numpy_to_vtk(arrays["normals"], deep=False)
+        normals.SetName("Normals")
+        surface.GetPointData().SetNormals(normals)
+    return surface
+
+
+class MeshStore(DiskStore):
+    """
+    Persistent on-disk cache of extracted isosurfaces.
+
+    Each entry is a set of raw .npy arrays (float32 points and normals, int32 cell
+    offsets and connectivity) plus a small JSON header, so reopening a series maps its
+    surfaces back zero-copy instead of running marching cubes. Entries are keyed by
+    the series key (folder or UID plus the source-file fingerprint, and any ROI and
+    filter chain applied), the isovalue, the smoothing and the extractor. Meshes of an
+    older fingerprint are dropped when the series is meshed again, and the least
+    recently used entries are evicted once the directory grows past its size cap.
+    """
+
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, "meshes"), budget_bytes=DEFAULT_MESH_STORE_MB * 1024 * 1024):
+        super().__init__(root, budget_bytes)
+
+    def _base(self, key):
+        return os.path.join(self.root, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def _paths(self, base):
+        return {name: f"{base}.{name}.npy" for name in ARRAYS}, base + ".json"
+
+    def contains(self, key):
+        return os.path.exists(self._paths(self._base(key))[1])
+
+    def load(self, key):
+        """
+        Maps a stored surface back into memory.
+
+        Returns:
+            A vtkPolyData over copy-on-write memory maps, or None on a miss.
+        """
+        array_paths, header_path = self._paths(self._base(key))
+        header = self._read_header(header_path)
+        try:
+            if header is None or header["key"] != repr(key):
+                return None
+            arrays = {
+                name: np.load(array_paths[name], mmap_mode="c") if name in header["arrays"] else None
+                for name in ARRAYS
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._touch(header_path)
+        return mesh_from_arrays(arrays)
+
+    def save(self, key, surface):
+        arrays = mesh_arrays(surface)
+        if arrays is None:
+            return
+        source = root_key(key[0])
+        header = {
+            "key": repr(key),
+            "source": repr(source[0]) if isinstance(source, tuple) else repr(source),
+            "fingerprint": source[1] if isinstance(source, tuple) and len(source) > 1 else None,
+            "arrays": [name for name in ARRAYS if arrays[name] is not None],
+            "points": int(len(arrays["points"])),
+            "cells": int(max(len(arrays["offsets"]) - 1, 0)),
+            "nbytes": int(sum(array.nbytes for array in arrays.values() if array is not None)),
+        }
+
+        self._write(
+            self._base(key),
+            {name: np.ascontiguousarray(arrays[name]) for name in header["arrays"]},
+            header,
+        )
+
+    def _is_stale(self, header, other):
+        # Meshes of an older fingerprint of the same series can never be hit again
+        return (
+            header["fingerprint"] is not None
+            and other.get("source") == header["source"]
+            and other.get("fingerprint") != header["fingerprint"]
+        )
+
+
+# Shared instance used across the application
+mesh_store = MeshStore()
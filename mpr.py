@@ -0,0 +1,166 @@
+import numpy as np
+
+from PyQt5.QtGui import QImage
+
+
+# Which volume axis each view slices through, for a (z, y, x) array
+ORIENTATIONS = {"axial": 0, "coronal": 1, "sagittal": 2}
+
+
+class WindowLevelLUT:
+    """
+    Window/level as a lookup table from every 16-bit voxel value to an 8-bit grey.
+
+    The table is rebuilt only when the window or level changes and can be shared by all
+    views of a series, so a contrast change costs one build plus one table lookup per
+    visible slice.
+    """
+
+    def __init__(self, window=400, level=40):
+        self.window = window
+        self.level = level
+        self._tables = {}
+
+    def set(self, window, level):
+        window = max(window, 1)
+        if (window, level) != (self.window, self.level):
+            self.window = window
+            self.level = level
+            self._tables.clear()
+
+    def supports(self, dtype):
+        return dtype in (np.dtype(np.int16), np.dtype(np.uint16))
+
+    def table(self, dtype):
+        """
+        Returns the table for a 16-bit dtype, indexed by the voxels' uint16 bit pattern.
+        """
+        table = self._tables.get(dtype)
+        if table is None:
+            values = np.arange(65536, dtype=np.uint16).view(dtype).astype(np.float32)
+            low = self.level - self.window / 2.0
+            table = np.clip((values - low) * (255.0 / self.window), 0, 255).astype(np.uint8)
+            self._tables[dtype] = table
+        return table
+
+
+class SliceView:
+    """
+    Displays one orthogonal plane of a (z, y, x) volume straight from the voxel array.
+
+    Nothing is rendered through VTK. Each frame gathers the visible slice through index
+    maps computed once per display size, applies window/level through a shared lookup
+    table (or vectorized arithmetic for non 16-bit volumes) into a reused uint8 buffer
+    and wraps that buffer in a QImage without copying. Planes are
+    laid out like vtkImageViewer2: axial shows x right and y up, coronal x right and z
+    up, sagittal y right and z up.
+
+    Args:
+        array: (z, y, x) voxel array; a contiguous view of the cached volume is used as is.
+        spacing: (x, y, z) voxel spacing, used to keep the aspect ratio.
+        orientation: "axial", "coronal" or "sagittal".
+        lut: WindowLevelLUT shared with the other views; a private one by default.
+    """
+
+    def __init__(self, array, spacing, orientation, lut=None):
+        self.orientation = orientation
+        self.axis = ORIENTATIONS[orientation]
+        self.lut = lut if lut is not None else WindowLevelLUT()
+        self.set_volume(array, spacing)
+        self.slice = self.slice_max() // 2
+
+    def set_volume(self, array, spacing=None):
+        # Swap in another volume of the same series (e.g. a filtered one) without resetting the view
+        self.array = np.ascontiguousarray(array)
+        if spacing is not None:
+            self.spacing = tuple(spacing)
+        self.flat = self.array.reshape(-1)
+        self.display_size = None
+        self.clear_preview()
+
+    def slice_max(self):
+        return max(self.array.shape[self.axis] - 1, 0)
+
+    def set_slice(self, index):
+        self.slice = min(max(int(index), 0), self.slice_max())
+
+    def set_preview(self, plane, index):
+        """
+        Shows a replacement plane (e.g. a filter preview) while the view is at slice index.
+
+        Args:
+            plane: 2D array of the slice taken along this view's axis, in volume order.
+            index: The slice the plane belongs to; other slices show the volume as usual.
+        """
+        self.preview = np.ascontiguousarray(plane, dtype=self.array.dtype).reshape(-1)
+        self.preview_slice = index
+
+    def clear_preview(self):
+        self.preview = None
+        self.preview_slice = None
+
+    def set_window_level(self, window, level):
+        self.lut.set(window, level)
+
+    def _plane_axes(self):
+        # (vertical, horizontal) volume axes of the displayed plane
+        return {0: (1, 2), 1: (0, 2), 2: (0, 1)}[self.axis]
+
+    def _layout(self, width, height):
+        # Fit the plane into the widget keeping its physical aspect ratio, then build the index maps once
+        vertical, horizontal = self._plane_axes()
+        size_mm = {0: self.spacing[2], 1: self.spacing[1], 2: self.spacing[0]}
+        n_v, n_h = self.array.shape[vertical], self.array.shape[horizontal]
+        scale = min(width / (n_h * size_mm[horizontal]), height / (n_v * size_mm[vertical]))
+        # QImage wants 32-bit aligned scanlines, so the width is kept a multiple of 4
+        out_w = max(int(round(n_h * size_mm[horizontal] * scale)) // 4 * 4, 4)
+        out_h = max(int(round(n_v * size_mm[vertical] * scale)), 1)
+
+        # Display rows run top to bottom, so the vertical axis is flipped
+        rows = (n_v - 1) - np.minimum((np.arange(out_h) + 0.5) * n_v / out_h, n_v - 1).astype(np.intp)
+        cols = np.minimum((np.arange(out_w) + 0.5) * n_h / out_w, n_h - 1).astype(np.intp)
+
+        strides = [s // self.array.itemsize for s in self.array.strides]
+        self.index = rows[:, None] * strides[vertical] + cols[None, :] * strides[horizontal]
+        self.plane_index = rows[:, None] * n_h + cols[None, :]
+        self.slice_stride = strides[self.axis]
+        self.index_scratch = np.empty_like(self.index)
+        self.values = np.empty(self.index.shape, dtype=self.array.dtype)
+        self.scratch = None
+
+        self.pixels = np.zeros((out_h, out_w), dtype=np.uint8)
+        self.image = QImage(self.pixels.data, out_w, out_h, out_w, QImage.Format_Grayscale8)
+        self.display_size = (width, height)
+
+    def render(self, width, height):
+        """
+        Maps the current slice into the display buffer.
+
+        Returns:
+            A QImage sharing memory with the buffer; it stays valid until the next render().
+        """
+        if not self.array.size:
+            # An empty volume has no plane to lay out; show nothing rather than divide by zero
+            return QImage()
+        if self.display_size != (width, height):
+            self._layout(width, height)
+
+        # Gather the slice at display resolution straight from the volume, or from the preview plane
+        if self.preview is not None and self.preview_slice == self.slice:
+            np.take(self.preview, self.plane_index, out=self.values, mode="clip")
+        else:
+            np.add(self.index, self.slice * self.slice_stride, out=self.index_scratch)
+            np.take(self.flat, self.index_scratch, out=self.values, mode="clip")
+
+        # Window/level into the reused uint8 buffer
+        if self.lut.supports(self.values.dtype):
+            np.take(self.lut.table(self.values.dtype), self.values.view(np.uint16), out=self.pixels, mode="clip")
+        else:
+            if self.scratch is None:
+                self.scratch = np.empty(self.index.shape, dtype=np.float32)
+            low = self.lut.level - self.lut.window / 2.0
+            np.subtract(self.values, low, out=self.scratch, casting="unsafe")
+            np.multiply(self.scratch, 255.0 / self.lut.window, out=self.scratch)
+            np.clip(self.scratch, 0, 255, out=self.scratch)
+            np.copyto(self.pixels, self.scratch, casting="unsafe")
+        return self.image
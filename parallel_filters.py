@@ -0,0 +1,199 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from filter_chain import stage_radius
+from instrumentation import span
+from series_loader import _keep_alive, image_to_array
+
+
+# Worker processes for slab filtering; 0 uses every core, 1 keeps filtering in-process
+DEFAULT_FILTER_PROCESSES = int(os.environ.get("DICOM_VIEWER_FILTER_PROCESSES", "0"))
+
+# Thinnest slab worth shipping to a worker, in slices
+MIN_SLAB_DEPTH = 8
+
+
+def make_filter(name, parameter):
+    """
+    Builds the VTK filter of a stage, configured exactly like the Visualizer filters.
+
+    Args:
+        name: "denoise" (median, parameter is the kernel size) or "smooth" (Gaussian,
+            parameter is the standard deviation in voxels).
+    """
+    if name == "denoise":
+        image_filter = vtk.vtkImageMedian3D()
+        image_filter.SetKernelSize(parameter, parameter, parameter)
+    elif name == "smooth":
+        image_filter = vtk.vtkImageGaussianSmooth()
+        image_filter.SetStandardDeviation(parameter)
+    else:
+        raise ValueError(f"No slab filter for stage {name!r}")
+    return image_filter
+
+
+def slab_bounds(depth, halo, slabs):
+    """
+    Splits depth slices into (start, stop) slabs and the haloed range each one reads.
+
+    Returns:
+        A list of ((start, stop), (read_start, read_stop)) pairs.
+    """
+    edges = np.linspace(0, depth, slabs + 1).astype(int)
+    bounds = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            bounds.append(((int(start), int(stop)), (max(int(start) - halo, 0), min(int(stop) + halo, depth))))
+    return bounds
+
+
+def _init_worker():
+    # Every process filters one slab at a time; VTK's own threads would only oversubscribe the cores
+    vtk.vtkMultiThreader.SetGlobalMaximumNumberOfThreads(1)
+
+
+def _filter_slab(input_name, output_name, shape, dtype, name, parameter, write, read):
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    try:
+        volume = np.ndarray(shape, dtype=dtype, buffer=input_shm.buf)
+        output = np.ndarray(shape, dtype=dtype, buffer=output_shm.buf)
+        nz, ny, nx = shape
+
+        # The haloed slab keeps its place in the volume, so VTK only sees a true boundary at the volume's faces
+        slab = volume[read[0]:read[1]]
+        image = vtk.vtkImageData()
+        image.SetExtent(0, nx - 1, 0, ny - 1, read[0], read[1] - 1)
+        image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(slab.reshape(-1), deep=False))
+
+        image_filter = make_filter(name, parameter)
+        image_filter.SetInputData(image)
+        image_filter.UpdateExtent((0, nx - 1, 0, ny - 1, write[0], write[1] - 1))
+
+        result = image_filter.GetOutput()
+        first = result.GetExtent()[4]
+        output[write[0]:write[1]] = image_to_array(result)[write[0] - first:write[1] - first]
+        del volume, output, slab, image, image_filter, result
+    finally:
+        input_shm.close()
+        output_shm.close()
+    return write[1] - write[0]
+
+
+class SlabFilterEngine:
+    """
+    Median and Gaussian filtering of large volumes on all cores.
+
+    The volume is copied once into shared memory and split into z-slabs; each worker
+    process filters its slab plus a halo of the kernel radius and writes the interior
+    straight into a shared output array, so no voxels are pickled. The result is
+    identical to running the same VTK filter over the whole volume.
+
+    Args:
+        processes: Worker processes; 0 uses every core.
+        slabs_per_process: Slabs queued per process, to balance uneven slabs.
+    """
+
+    def __init__(self, processes=DEFAULT_FILTER_PROCESSES, slabs_per_process=4):
+        self.processes = processes or os.cpu_count() or 1
+        self.slabs_per_process = slabs_per_process
+        self._executor = None
+
+    @property
+    def parallel(self):
+        return self.processes > 1
+
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.processes, mp_context=get_context("spawn"), initializer=_init_worker
+            )
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def run(self, array, name, parameter, job=None):
+        """
+        Filters a (z, y, x) array.
+
+        Args:
+            array: The volume to filter.
+            name: "denoise" or "smooth".
+            parameter: Kernel size or standard deviation, as for the Visualizer filters.
+            job: Optional FilterJob; progress counts finished slabs and cancelling drops
+                the slabs not started yet.
+
+        Returns:
+            The filtered array, backed by shared memory, or None if the job was cancelled.
+        """
+        halo = stage_radius(name, parameter)
+        slabs = max(min(self.processes * self.slabs_per_process, array.shape[0] // MIN_SLAB_DEPTH), 1)
+        bounds = slab_bounds(array.shape[0], halo, slabs)
+
+        input_shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        output_shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        try:
+            shared_input = np.ndarray(array.shape, dtype=array.dtype, buffer=input_shm.buf)
+            shared_input[...] = array
+            del shared_input
+
+            executor = self.executor()
+            futures = [
+                executor.submit(
+                    _filter_slab, input_shm.name, output_shm.name, array.shape, array.dtype, name, parameter, write, read
+                )
+                for write, read in bounds
+            ]
+            done = 0
+            for future in as_completed(futures):
+                if job is not None and job.cancelled:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                done += future.result()
+                if job is not None:
+                    job.report(done / array.shape[0])
+        except BaseException:
+            output_shm.close()
+            output_shm.unlink()
+            raise
+        finally:
+            input_shm.close()
+            input_shm.unlink()
+
+        # Slabs already running still write to the output block; the mapping outlives the name
+        output_shm.unlink()
+        if job is not None and job.cancelled:
+            output_shm.close()
+            return None
+        output = np.ndarray(array.shape, dtype=array.dtype, buffer=output_shm.buf)
+        return _keep_alive(output, output_shm)
+
+    def filter_image(self, image_data, name, parameter, job=None):
+        """
+        Filters a vtkImageData, returning a new one with the same geometry, or None if cancelled.
+        """
+        with span("filter.slabs", stage=name, parameter=parameter, processes=self.processes):
+            output = self.run(image_to_array(image_data), name, parameter, job)
+        if output is None:
+            return None
+        filtered = vtk.vtkImageData()
+        filtered.SetExtent(image_data.GetExtent())
+        filtered.SetSpacing(image_data.GetSpacing())
+        filtered.SetOrigin(image_data.GetOrigin())
+        scalars = numpy_support.numpy_to_vtk(output.reshape(-1), deep=False)
+        scalars.SetName(image_data.GetPointData().GetScalars().GetName())
+        filtered.GetPointData().SetScalars(scalars)
+        return filtered
+
+
+# Shared instance used across the application
+slab_filter_engine = SlabFilterEngine()
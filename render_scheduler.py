@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QTimer
+
+from instrumentation import span
+
+
+VIEWS = ("3d", "axial", "coronal", "sagittal")
+
+
+class RenderScheduler(QObject):
+    """
+    Coalesces bursts of control events into at most one render per view per display frame.
+
+    Controls call request() instead of rendering. Each request marks a view dirty and may
+    carry an update callable keyed by what it changes ("slice", "isovalue", ...); a newer
+    update with the same key replaces the pending one, which is counted as dropped. On the
+    next frame tick every dirty view applies its surviving updates in order and renders
+    once.
+
+    Args:
+        frame_interval_ms: Minimum time between two flushes, normally one display frame.
+        parent: Optional parent QObject.
+    """
+
+    def __init__(self, frame_interval_ms=16, parent=None):
+        super(RenderScheduler, self).__init__(parent)
+        self.frame_interval_ms = frame_interval_ms
+        self.renderers = {}
+        self.queue_depth = {view: 0 for view in VIEWS}
+        self.dropped = {view: 0 for view in VIEWS}
+        self.renders = {view: 0 for view in VIEWS}
+        self._pending = {view: OrderedDict() for view in VIEWS}
+        self._dirty = set()
+        self._last_flush = 0.0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def set_renderer(self, view, render):
+        # render() draws the view with whatever state its updates have applied
+        self.renderers[view] = render
+
+    def request(self, view, key=None, update=None):
+        """
+        Marks a view dirty, optionally queueing an update to apply before it renders.
+
+        Args:
+            view: One of VIEWS.
+            key: What the update changes; a pending update with the same key is dropped.
+            update: Callable applying the new state, run on the next frame tick.
+        """
+        pending = self._pending[view]
+        self.queue_depth[view] += 1
+        if update is not None:
+            if key in pending:
+                self.dropped[view] += 1
+            pending[key] = update
+        self._dirty.add(view)
+
+        if not self._timer.isActive():
+            elapsed_ms = (time.perf_counter() - self._last_flush) * 1000.0
+            self._timer.start(max(int(self.frame_interval_ms - elapsed_ms), 0))
+
+    def flush(self):
+        self._last_flush = time.perf_counter()
+        dirty, self._dirty = self._dirty, set()
+        with span("frame", views=len(dirty)):
+            for view in VIEWS:
+                if view not in dirty:
+                    continue
+                pending, self._pending[view] = self._pending[view], OrderedDict()
+                self.queue_depth[view] = 0
+                for update in pending.values():
+                    update()
+                render = self.renderers.get(view)
+                if render is not None:
+                    render()
+                    self.renders[view] += 1
+
+    def stats(self):
+        return {
+            view: {
+                "queue_depth": self.queue_depth[view],
+                "dropped": self.dropped[view],
+                "renders": self.renders[view],
+            }
+            for view in VIEWS
+        }
@@ -0,0 +1,95 @@
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from series_loader import image_to_array
+
+
+class ROI:
+    """
+    An axis-aligned box of voxels, as half-open (start, stop) ranges per volume axis.
+
+    Args:
+        z: (start, stop) slice range.
+        y: (start, stop) row range.
+        x: (start, stop) column range.
+    """
+
+    def __init__(self, z, y, x):
+        self.z = (int(z[0]), int(z[1]))
+        self.y = (int(y[0]), int(y[1]))
+        self.x = (int(x[0]), int(x[1]))
+
+    @classmethod
+    def from_bounds(cls, image_data, bounds):
+        """
+        The voxels of image_data inside world bounds (xmin, xmax, ymin, ymax, zmin, zmax),
+        e.g. from a box widget. Returns None if the box misses the volume.
+        """
+        origin, spacing, dims = image_data.GetOrigin(), image_data.GetSpacing(), image_data.GetDimensions()
+        ranges = []
+        for axis in range(3):
+            low = (bounds[2 * axis] - origin[axis]) / spacing[axis]
+            high = (bounds[2 * axis + 1] - origin[axis]) / spacing[axis]
+            low, high = min(low, high), max(low, high)
+            start = min(max(int(np.floor(low)), 0), dims[axis])
+            stop = min(max(int(np.ceil(high)) + 1, 0), dims[axis])
+            if stop - start < 2:
+                return None
+            ranges.append((start, stop))
+        return cls(ranges[2], ranges[1], ranges[0])
+
+    def key(self):
+        return self.z + self.y + self.x
+
+    def __eq__(self, other):
+        return isinstance(other, ROI) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def shape(self):
+        return (self.z[1] - self.z[0], self.y[1] - self.y[0], self.x[1] - self.x[0])
+
+    def covers(self, shape):
+        # True when the box holds the whole volume, so cropping would change nothing
+        return self.key() == (0, shape[0], 0, shape[1], 0, shape[2])
+
+    def slices(self):
+        return (slice(*self.z), slice(*self.y), slice(*self.x))
+
+    def bounds(self, image_data):
+        # World bounds of the box in image_data's geometry, for placing a box widget
+        origin, spacing = image_data.GetOrigin(), image_data.GetSpacing()
+        ranges = (self.x, self.y, self.z)
+        return tuple(
+            origin[axis] + spacing[axis] * (ranges[axis][end] - end)
+            for axis in range(3) for end in (0, 1)
+        )
+
+
+def crop_image(image_data, roi):
+    """
+    The part of a volume inside an ROI, as a standalone vtkImageData.
+
+    Boxes spanning whole slices (only the z range is cropped) are a contiguous run of
+    the volume, so the voxels are shared without copying; any other box copies just its
+    own voxels. The origin moves to the first voxel, so the crop keeps its world position
+    while its extent starts at 0 like every other volume in the viewer.
+    """
+    array = image_to_array(image_data)[roi.slices()]
+    if not array.flags.c_contiguous:
+        array = np.ascontiguousarray(array)
+
+    origin, spacing = image_data.GetOrigin(), image_data.GetSpacing()
+    starts = (roi.x[0], roi.y[0], roi.z[0])
+    cropped = vtk.vtkImageData()
+    cropped.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+    cropped.SetSpacing(spacing)
+    cropped.SetOrigin(*(origin[axis] + spacing[axis] * starts[axis] for axis in range(3)))
+
+    # numpy_to_vtk keeps a reference to the array (a view of the source when zero-copy)
+    scalars = numpy_support.numpy_to_vtk(array.reshape(-1), deep=False)
+    scalars.SetName(image_data.GetPointData().GetScalars().GetName())
+    cropped.GetPointData().SetScalars(scalars)
+    return cropped
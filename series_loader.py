@@ -0,0 +1,337 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pydicom
+import vtk
+from vtk.util import numpy_support
+
+from volume_stats import VolumeStats, attach_stats
+
+
+class SeriesLoadError(Exception):
+    pass
+
+
+class NoImagesError(SeriesLoadError):
+    # The folder or file list holds no DICOM images at all, so it is not a series
+    pass
+
+
+def list_series_files(folder):
+    # Regular files directly inside the folder, the same set vtkDICOMImageReader scans
+    with os.scandir(folder) as entries:
+        return sorted(entry.path for entry in entries if entry.is_file())
+
+
+class SliceHeader:
+    # The handful of header fields needed to place and rescale one slice
+    def __init__(self, path, ds):
+        self.path = path
+        self.series_uid = str(ds.get("SeriesInstanceUID", ""))
+        self.rows = int(ds.Rows)
+        self.cols = int(ds.Columns)
+        self.orientation = tuple(float(v) for v in ds.get("ImageOrientationPatient", (1, 0, 0, 0, 1, 0)))
+        self.position = tuple(float(v) for v in ds.get("ImagePositionPatient", (0, 0, 0)))
+        self.pixel_spacing = tuple(float(v) for v in ds.get("PixelSpacing", (1.0, 1.0)))
+        self.thickness = float(ds.get("SliceThickness", 0) or 0)
+        self.instance = int(ds.get("InstanceNumber", 0) or 0)
+        self.slope = float(ds.get("RescaleSlope", 1) or 1)
+        self.intercept = float(ds.get("RescaleIntercept", 0) or 0)
+        self.bits_stored = int(ds.get("BitsStored", 16))
+        self.signed = int(ds.get("PixelRepresentation", 0)) == 1
+        self.saturate = False
+
+
+def read_header(path):
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+    except (pydicom.errors.InvalidDicomError, OSError):
+        return None
+    if "Rows" not in ds or "Columns" not in ds:
+        return None
+    return SliceHeader(path, ds)
+
+
+def output_dtype(headers):
+    """
+    Picks the voxel dtype for a series.
+
+    Integral slopes and intercepts decode to int16 (regular CT) or, when every rescaled
+    value is non-negative, to uint16 (MR, PET, DX stored on 16 bits); anything else to
+    float32.
+
+    Returns:
+        (dtype, saturate) where saturate is True when the stored bit depth could
+        produce values outside the dtype, so decoded slices must be clipped rather than
+        wrapped. That only happens for ranges straddling zero that neither 16-bit type
+        holds, e.g. 16-bit CT with a -1024 intercept, where just values above 32767 HU
+        are clipped.
+    """
+    if any(h.slope != int(h.slope) or h.intercept != int(h.intercept) for h in headers):
+        return np.dtype(np.float32), False
+    low, high = [], []
+    for h in headers:
+        lo, hi = (-(2 ** (h.bits_stored - 1)), 2 ** (h.bits_stored - 1) - 1) if h.signed else (0, 2 ** h.bits_stored - 1)
+        ends = (lo * h.slope + h.intercept, hi * h.slope + h.intercept)
+        low.append(min(ends))
+        high.append(max(ends))
+    low, high = min(low), max(high)
+    info = np.iinfo(np.int16)
+    if low >= info.min and high <= info.max:
+        return np.dtype(np.int16), False
+    if low >= 0:
+        return np.dtype(np.uint16), high > np.iinfo(np.uint16).max
+    return np.dtype(np.int16), True
+
+
+class SeriesLayout:
+    """
+    Sorted slice headers and the geometry of the volume they assemble into.
+    """
+
+    def __init__(self, headers):
+        first = headers[0]
+        row_dir = np.array(first.orientation[:3])
+        col_dir = np.array(first.orientation[3:])
+        normal = np.cross(row_dir, col_dir)
+
+        # Sort along the slice normal rather than by file name or instance number
+        headers = sorted(headers, key=lambda h: (float(np.dot(normal, h.position)), h.instance))
+        self.headers = headers
+        self.files = [h.path for h in headers]
+        self.series_uid = first.series_uid
+        self.shape = (len(headers), first.rows, first.cols)
+        self.dtype, saturate = output_dtype(headers)
+        for h in headers:
+            h.saturate = saturate
+
+        positions = np.array([np.dot(normal, h.position) for h in headers])
+        steps = np.diff(positions)
+        if len(steps) and np.median(steps) > 0:
+            z_spacing = float(np.median(steps))
+        else:
+            z_spacing = first.thickness or 1.0
+
+        # PixelSpacing is (row spacing, column spacing); VTK wants (x, y, z)
+        self.spacing = (first.pixel_spacing[1], first.pixel_spacing[0], z_spacing)
+        self.origin = headers[0].position
+        self.direction = tuple(row_dir) + tuple(col_dir) + tuple(normal)
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+def scan_series(folder=None, files=None, series_uid=None, workers=None):
+    """
+    Reads only the headers of a series and works out its slice order and geometry.
+
+    Args:
+        folder: Folder to scan; ignored when files is given.
+        files: Explicit list of DICOM files.
+        series_uid: Series to pick out of a mixed folder. Defaults to the largest series.
+        workers: Number of threads used to parse headers.
+    """
+    if files is None:
+        files = list_series_files(folder)
+    with ThreadPoolExecutor(workers or os.cpu_count()) as executor:
+        headers = [h for h in executor.map(read_header, files) if h is not None]
+
+    # Mixed folders hold several series; group them by UID and slice geometry
+    groups = {}
+    for h in headers:
+        groups.setdefault((h.series_uid, h.rows, h.cols, h.orientation), []).append(h)
+    if series_uid is not None:
+        groups = {k: v for k, v in groups.items() if k[0] == series_uid}
+    if not groups:
+        raise NoImagesError(f"No DICOM images found in {folder or 'the given files'}")
+
+    return SeriesLayout(max(groups.values(), key=len))
+
+
+def decode_slice(header, out):
+    """
+    Decodes one slice and writes the rescaled pixels straight into its plane of the volume.
+    """
+    try:
+        pixels = pydicom.dcmread(header.path).pixel_array
+    except (pydicom.errors.InvalidDicomError, RuntimeError, NotImplementedError, ValueError, AttributeError) as error:
+        # Compressed transfer syntaxes without a decoder plugin, or broken pixel data; the
+        # caller falls back to vtkDICOMImageReader or reports the series as unreadable
+        raise SeriesLoadError(f"Cannot decode {header.path}: {error}") from error
+
+    # Flip rows so the volume has VTK's lower-left origin, as vtkDICOMImageReader does
+    pixels = pixels[::-1]
+    if header.saturate:
+        info = np.iinfo(out.dtype)
+        rescaled = pixels * np.float32(header.slope) + np.float32(header.intercept)
+        np.clip(rescaled, info.min, info.max, out=rescaled)
+        np.copyto(out, rescaled, casting="unsafe")
+    elif header.slope == 1 and header.intercept == 0:
+        np.copyto(out, pixels, casting="unsafe")
+    else:
+        np.multiply(pixels, header.slope, out=out, casting="unsafe")
+        np.add(out, header.intercept, out=out, casting="unsafe")
+
+
+# Per-process view of the shared output volume, set up by _attach_volume
+_shared_volume = None
+
+
+def _attach_volume(name, shape, dtype):
+    global _shared_volume
+    shm = shared_memory.SharedMemory(name=name)
+    _shared_volume = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _decode_shared(index, header):
+    decode_slice(header, _shared_volume[1][index])
+    return index
+
+
+class SeriesVolume:
+    """
+    A decoded series: the voxel array in (z, y, x) order plus its geometry and, once
+    every slice is in, its VolumeStats.
+    """
+
+    def __init__(self, array, spacing, origin, direction=(1, 0, 0, 0, 1, 0, 0, 0, 1), series_uid="", stats=None):
+        self.array = array
+        self.spacing = tuple(spacing)
+        self.origin = tuple(origin)
+        self.direction = tuple(direction)
+        self.series_uid = series_uid
+        self.stats = stats
+
+
+def allocate_volume(layout, use_processes=False):
+    if not use_processes:
+        return np.empty(layout.shape, dtype=layout.dtype), None
+    shm = shared_memory.SharedMemory(create=True, size=max(layout.nbytes, 1))
+    return np.ndarray(layout.shape, dtype=layout.dtype, buffer=shm.buf), shm
+
+
+def load_series(folder=None, files=None, series_uid=None, workers=None, use_processes=False):
+    """
+    Loads a series with pydicom, decoding slices in parallel into one preallocated array.
+
+    Args:
+        folder: Folder holding the series.
+        files: Explicit list of files to load instead of scanning a folder.
+        series_uid: Series to load from a mixed folder. Defaults to the largest series.
+        workers: Pool size (default is the CPU count).
+        use_processes: Decode in a process pool writing into shared memory instead of threads.
+            Faster for uncompressed data, where pydicom is bound by the GIL.
+
+    Returns:
+        A SeriesVolume, with statistics gathered as the slices landed.
+    """
+    workers = workers or os.cpu_count()
+    layout = scan_series(folder, files, series_uid, workers)
+    volume, shm = allocate_volume(layout, use_processes)
+    stats = VolumeStats.for_dtype(layout.dtype)
+
+    if shm is None:
+        for _ in stream_series(layout, volume, workers=workers, stats=stats):
+            pass
+    else:
+        try:
+            with ProcessPoolExecutor(
+                workers,
+                mp_context=get_context("spawn"),
+                initializer=_attach_volume,
+                initargs=(shm.name, layout.shape, layout.dtype),
+            ) as executor:
+                for index in executor.map(_decode_shared, range(len(layout.headers)), layout.headers, chunksize=8):
+                    stats.add(volume[index])
+        finally:
+            # The mapping stays valid for this process; unlinking just frees the name
+            shm.unlink()
+        volume = _keep_alive(volume, shm)
+
+    return SeriesVolume(volume, layout.spacing, layout.origin, layout.direction, layout.series_uid, stats.trimmed())
+
+
+def middle_out_order(count):
+    # Middle slice first, then alternating outwards, so the first paint is the most useful one
+    middle = (count - 1) // 2
+    order = [middle]
+    for offset in range(1, count):
+        for index in (middle + offset, middle - offset):
+            if 0 <= index < count:
+                order.append(index)
+    return order[:count]
+
+
+def fill_value(layout):
+    # What a stored pixel value of 0 rescales to, usually air for CT
+    first = layout.headers[0]
+    return first.intercept if layout.dtype.kind == "f" else int(first.intercept)
+
+
+def stream_series(layout, volume, order=None, workers=None, cancel=None, stats=None):
+    """
+    Decodes slices into a preallocated volume, yielding each slice index as it lands.
+
+    Args:
+        layout: SeriesLayout from scan_series().
+        volume: Array of layout.shape and layout.dtype to fill.
+        order: Order in which slices are submitted; defaults to middle-out.
+        workers: Number of decoding threads.
+        cancel: Optional threading.Event; once set, pending slices are dropped and the generator stops.
+        stats: Optional VolumeStats each slice is counted into as it lands, while still in cache.
+    """
+    if order is None:
+        order = middle_out_order(len(layout.headers))
+    executor = ThreadPoolExecutor(workers or os.cpu_count())
+    try:
+        futures = {executor.submit(decode_slice, layout.headers[i], volume[i]): i for i in order}
+        for future in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                return
+            future.result()
+            if stats is not None:
+                stats.add(volume[futures[future]])
+            yield futures[future]
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class _SharedArray(np.ndarray):
+    # ndarray subclass that holds on to the SharedMemory block backing it
+    pass
+
+
+def _keep_alive(array, shm):
+    array = array.view(_SharedArray)
+    array.shm = shm
+    return array
+
+
+def to_vtk_image(volume):
+    """
+    Wraps a SeriesVolume as vtkImageData without copying the voxels.
+    """
+    array = volume.array
+    image = vtk.vtkImageData()
+    image.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+    image.SetSpacing(*volume.spacing)
+    image.SetOrigin(*volume.origin)
+
+    # numpy_to_vtk keeps a reference to the array, so the buffer outlives this function
+    scalars = numpy_support.numpy_to_vtk(array.reshape(-1), deep=False)
+    scalars.SetName("DICOMImage")
+    image.GetPointData().SetScalars(scalars)
+    if volume.stats is not None:
+        attach_stats(image, volume.stats)
+    return image
+
+
+def image_to_array(image):
+    """
+    Returns a (z, y, x) NumPy view of a vtkImageData's scalars.
+    """
+    nx, ny, nz = image.GetDimensions()
+    return numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(nz, ny, nx)
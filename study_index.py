@@ -0,0 +1,273 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pydicom
+
+from disk_store import DEFAULT_CACHE_DIR
+from volume_cache import fingerprint
+
+
+DEFAULT_INDEX_PATH = os.environ.get("DICOM_VIEWER_INDEX", os.path.join(DEFAULT_CACHE_DIR, "index.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    patient_name TEXT
+);
+CREATE TABLE IF NOT EXISTS studies (
+    study_uid TEXT PRIMARY KEY,
+    patient_id TEXT,
+    study_date TEXT,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS series (
+    series_uid TEXT PRIMARY KEY,
+    study_uid TEXT,
+    modality TEXT,
+    number INTEGER,
+    description TEXT,
+    rows INTEGER,
+    cols INTEGER,
+    instances INTEGER,
+    folder TEXT,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS instances (
+    path TEXT PRIMARY KEY,
+    series_uid TEXT,
+    sop_uid TEXT,
+    instance_number INTEGER,
+    slice_position REAL,
+    position TEXT,
+    orientation TEXT,
+    mtime_ns INTEGER,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS skipped (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS instances_series ON instances (series_uid);
+CREATE INDEX IF NOT EXISTS series_study ON series (study_uid);
+"""
+
+
+def _text(ds, keyword):
+    value = ds.get(keyword, "")
+    return str(value) if value is not None else ""
+
+
+def read_record(path):
+    """
+    Parses the header of one file into a flat record, or None if it is not an image.
+    """
+    try:
+        ds = pydicom.dcmread(path, stop_before_pixels=True)
+    except Exception:
+        return None
+    if "Rows" not in ds or "Columns" not in ds or "SeriesInstanceUID" not in ds:
+        return None
+
+    orientation = [float(v) for v in ds.get("ImageOrientationPatient", (1, 0, 0, 0, 1, 0))]
+    position = [float(v) for v in ds.get("ImagePositionPatient", (0, 0, 0))]
+    normal = np.cross(orientation[:3], orientation[3:])
+    return {
+        "path": path,
+        "patient_id": _text(ds, "PatientID"),
+        "patient_name": _text(ds, "PatientName"),
+        "study_uid": _text(ds, "StudyInstanceUID"),
+        "study_date": _text(ds, "StudyDate"),
+        "study_description": _text(ds, "StudyDescription"),
+        "series_uid": _text(ds, "SeriesInstanceUID"),
+        "modality": _text(ds, "Modality"),
+        "series_number": int(ds.get("SeriesNumber", 0) or 0),
+        "series_description": _text(ds, "SeriesDescription"),
+        "sop_uid": _text(ds, "SOPInstanceUID"),
+        "instance_number": int(ds.get("InstanceNumber", 0) or 0),
+        "rows": int(ds.Rows),
+        "cols": int(ds.Columns),
+        "slice_position": float(np.dot(normal, position)),
+        "position": "\\".join(repr(v) for v in position),
+        "orientation": "\\".join(repr(v) for v in orientation),
+    }
+
+
+def _read_records(paths):
+    # One task per chunk keeps the pickling overhead per file small
+    return [(path, read_record(path)) for path in paths]
+
+
+class StudyIndex:
+    """
+    Header-only index of every DICOM file under some directory trees, kept in SQLite.
+
+    scan() parses only the files that are new or changed since the last scan (by
+    modification time and size), in parallel and without reading pixel data, and
+    forgets files that disappeared. Series can then be listed and opened by UID
+    straight from the index.
+
+    Args:
+        path: SQLite database file.
+        workers: Header parsing processes; 0 uses every core.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, workers=0):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self._lock = threading.Lock()
+        self._created = False
+
+    def _connect(self):
+        # The database is only created on first use, so importing this module never touches
+        # the disk; raises OSError or sqlite3.Error if it cannot be opened
+        if not self._created:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        if not self._created:
+            with db:
+                db.executescript(SCHEMA)
+            self._created = True
+        return db
+
+    def scan(self, root, progress=None, chunk_size=64):
+        """
+        Brings the index up to date with a directory tree.
+
+        Args:
+            root: Directory to walk.
+            progress: Optional callable(done, total) called as header chunks are parsed.
+
+        Returns:
+            Counts of the files seen, parsed, removed and of the series touched.
+        """
+        root = os.path.abspath(root)
+        found = {}
+        for folder, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (stat.st_mtime_ns, stat.st_size)
+
+        prefix = os.path.join(root, "")
+        with self._lock, self._connect() as db:
+            known = {}
+            for table in ("instances", "skipped"):
+                for row in db.execute(
+                    f"SELECT path, mtime_ns, size FROM {table} WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+                ):
+                    known[row["path"]] = (row["mtime_ns"], row["size"])
+
+        changed = [path for path, stat in found.items() if known.get(path) != stat]
+        removed = [path for path in known if path not in found]
+
+        records = []
+        if changed:
+            chunks = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+            if self.workers > 1 and len(chunks) > 1:
+                with ProcessPoolExecutor(self.workers, mp_context=get_context("spawn")) as executor:
+                    for done, chunk in enumerate(executor.map(_read_records, chunks), 1):
+                        records.extend(chunk)
+                        if progress is not None:
+                            progress(min(done * chunk_size, len(changed)), len(changed))
+            else:
+                for done, chunk in enumerate(chunks, 1):
+                    records.extend(_read_records(chunk))
+                    if progress is not None:
+                        progress(min(done * chunk_size, len(changed)), len(changed))
+
+        with self._lock, self._connect() as db:
+            touched = set()
+            for path in removed + changed:
+                row = db.execute("SELECT series_uid FROM instances WHERE path = ?", (path,)).fetchone()
+                if row is not None:
+                    touched.add(row["series_uid"])
+            db.executemany("DELETE FROM instances WHERE path = ?", [(path,) for path in removed + changed])
+            db.executemany("DELETE FROM skipped WHERE path = ?", [(path,) for path in removed + changed])
+
+            for path, record in records:
+                mtime_ns, size = found[path]
+                if record is None:
+                    db.execute("INSERT INTO skipped VALUES (?, ?, ?)", (path, mtime_ns, size))
+                    continue
+                touched.add(record["series_uid"])
+                db.execute(
+                    "INSERT OR REPLACE INTO patients VALUES (?, ?)", (record["patient_id"], record["patient_name"])
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO studies VALUES (?, ?, ?, ?)",
+                    (record["study_uid"], record["patient_id"], record["study_date"], record["study_description"]),
+                )
+                db.execute(
+                    "INSERT INTO instances VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        path, record["series_uid"], record["sop_uid"], record["instance_number"],
+                        record["slice_position"], record["position"], record["orientation"], mtime_ns, size,
+                    ),
+                )
+                db.execute(
+                    "INSERT OR IGNORE INTO series (series_uid, study_uid, modality, number, description, rows, cols)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        record["series_uid"], record["study_uid"], record["modality"], record["series_number"],
+                        record["series_description"], record["rows"], record["cols"],
+                    ),
+                )
+
+            # Refresh the summary of every series that gained or lost files
+            for series_uid in touched:
+                paths = [row["path"] for row in db.execute(
+                    "SELECT path FROM instances WHERE series_uid = ? ORDER BY slice_position", (series_uid,)
+                )]
+                if not paths:
+                    db.execute("DELETE FROM series WHERE series_uid = ?", (series_uid,))
+                    continue
+                db.execute(
+                    "UPDATE series SET instances = ?, folder = ?, fingerprint = ? WHERE series_uid = ?",
+                    (len(paths), os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(paths[0]),
+                     fingerprint(paths), series_uid),
+                )
+            db.execute("DELETE FROM studies WHERE study_uid NOT IN (SELECT study_uid FROM series)")
+            db.execute("DELETE FROM patients WHERE patient_id NOT IN (SELECT patient_id FROM studies)")
+
+        return {"files": len(found), "parsed": len(changed), "removed": len(removed), "series": len(touched)}
+
+    def list_series(self, root=None):
+        """
+        Every indexed series, optionally limited to those under root, with patient and study details.
+        """
+        query = (
+            "SELECT series.*, studies.study_date, studies.description AS study_description,"
+            " patients.patient_id, patients.patient_name"
+            " FROM series JOIN studies USING (study_uid) JOIN patients USING (patient_id)"
+        )
+        args = ()
+        if root is not None:
+            prefix = os.path.join(os.path.abspath(root), "")
+            query += " WHERE series.folder = ? OR substr(series.folder, 1, ?) = ?"
+            args = (prefix.rstrip(os.sep), len(prefix), prefix)
+        query += " ORDER BY patients.patient_name, studies.study_date, series.number"
+        with self._connect() as db:
+            return [dict(row) for row in db.execute(query, args)]
+
+    def series_files(self, series_uid):
+        """
+        Paths of a series' files in slice order, straight from the index.
+        """
+        with self._connect() as db:
+            return [row["path"] for row in db.execute(
+                "SELECT path FROM instances WHERE series_uid = ? ORDER BY slice_position, instance_number",
+                (series_uid,),
+            )]
+
+
+# Shared instance used across the application
+study_index = StudyIndex()
@@ -0,0 +1,147 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import vtk
+
+from memory import memory_manager
+
+
+# Most triangles drawn while the camera is moving
+DEFAULT_TRIANGLE_BUDGET = int(os.environ.get("DICOM_VIEWER_TRIANGLE_BUDGET", "300000"))
+
+# Target reductions of the decimated levels, finest first
+DEFAULT_REDUCTIONS = (0.5, 0.8, 0.95)
+
+_executor = ThreadPoolExecutor(1)
+
+# Distinguishes the levels of different SurfaceLODs in the memory manager
+_level_ids = itertools.count()
+
+
+def decimate(surface, reduction):
+    """
+    Quadric decimation of a triangle mesh, with normals recomputed for shading.
+
+    Args:
+        surface: The vtkPolyData triangle mesh.
+        reduction: Fraction of triangles to remove, e.g. 0.9 keeps about a tenth.
+    """
+    # Weld duplicated points (e.g. on brick seams) so decimation cannot open cracks
+    cleaner = vtk.vtkCleanPolyData()
+    cleaner.SetInputData(surface)
+
+    decimation = vtk.vtkQuadricDecimation()
+    decimation.SetInputConnection(cleaner.GetOutputPort())
+    decimation.SetTargetReduction(reduction)
+    decimation.VolumePreservationOn()
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(decimation.GetOutputPort())
+    normals.SplittingOff()
+    normals.Update()
+
+    output = vtk.vtkPolyData()
+    output.ShallowCopy(normals.GetOutput())
+    return output
+
+
+class SurfaceLOD:
+    """
+    A full resolution surface plus decimated levels built on a background thread.
+
+    Levels are only built when the full mesh exceeds the triangle budget. Until they are
+    ready, interactive_surface() falls back to the full mesh. Each level is reported to
+    the memory manager as a surface of its series, and dropped again when evicted.
+
+    Args:
+        surface: Full resolution vtkPolyData.
+        triangle_budget: Most triangles to draw while the camera is moving.
+        reductions: Target reductions of the decimated levels, finest first.
+        series_key: Key of the series the surface was contoured from, for the memory breakdown.
+    """
+
+    def __init__(self, surface, triangle_budget=DEFAULT_TRIANGLE_BUDGET, reductions=DEFAULT_REDUCTIONS, series_key=None):
+        self.surface = surface
+        self.triangle_budget = triangle_budget
+        self.series_key = series_key
+        self.levels = []
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+        if surface.GetNumberOfPolys() > triangle_budget:
+            for reduction in reductions:
+                _executor.submit(self._build, reduction)
+
+    def _build(self, reduction):
+        if self._cancelled:
+            return
+        level = decimate(self.surface, reduction)
+        key = ("lod", next(_level_ids), reduction)
+        with self._lock:
+            if self._cancelled:
+                return
+            self.levels.append(level)
+            self.levels.sort(key=lambda mesh: -mesh.GetNumberOfPolys())
+            self._tracked[key] = level
+        memory_manager.track("surface_lods", key, level, "surface", series_key=self.series_key, evict=self._drop_level)
+
+    def _drop_level(self, key):
+        # Evicted by the memory manager; interaction falls back to a coarser level or the full mesh
+        with self._lock:
+            level = self._tracked.pop(key, None)
+            if level is not None:
+                self.levels.remove(level)
+
+    def cancel(self):
+        # Levels not started yet are skipped, and built ones released, once the surface has been replaced
+        with self._lock:
+            self._cancelled = True
+            keys = list(self._tracked)
+            self._tracked.clear()
+            self.levels = []
+        for key in keys:
+            memory_manager.release("surface_lods", key)
+
+    def interactive_surface(self):
+        # Finest level within the budget, else the coarsest level built so far
+        with self._lock:
+            if self.surface.GetNumberOfPolys() <= self.triangle_budget or not self.levels:
+                return self.surface
+            for level in self.levels:
+                if level.GetNumberOfPolys() <= self.triangle_budget:
+                    return level
+            return self.levels[-1]
+
+
+# Recently shown surfaces keep their levels, so revisiting an isovalue does not decimate again
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def lod_for(surface, triangle_budget=DEFAULT_TRIANGLE_BUDGET, keep=8, series_key=None):
+    key = (surface.GetAddressAsString("vtkPolyData"), triangle_budget)
+    with _recent_lock:
+        lod = _recent.get(key)
+        if lod is None or lod.surface is not surface:
+            lod = SurfaceLOD(surface, triangle_budget, series_key=series_key)
+            _recent[key] = lod
+        _recent.move_to_end(key)
+        while len(_recent) > keep:
+            _, evicted = _recent.popitem(last=False)
+            evicted.cancel()
+        return lod
+
+
+def forget(surface):
+    """
+    Drops the levels of a surface its cache has evicted, so they no longer pin it in memory.
+    """
+    with _recent_lock:
+        keys = [key for key, lod in _recent.items() if lod.surface is surface]
+        lods = [_recent.pop(key) for key in keys]
+    for lod in lods:
+        lod.cancel()
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import vtk
+
+from instrumentation import span
+from memory import memory_manager
+from series_loader import NoImagesError, SeriesLoadError, SeriesVolume, image_to_array, list_series_files, load_series, to_vtk_image
+from volume_stats import VolumeStats
+from volume_store import volume_store
+
+
+# Default memory budget for decoded volumes, overridable through the environment
+DEFAULT_BUDGET_MB = int(os.environ.get("DICOM_VIEWER_CACHE_MB", "2048"))
+
+
+def fingerprint(paths):
+    """
+    Hashes the names, modification times and sizes of a set of files.
+
+    Args:
+        paths: Iterable of file paths making up one series.
+
+    Returns:
+        A hex digest that changes whenever any of the files is added, removed or rewritten.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode())
+    return digest.hexdigest()
+
+
+def read_dicom_folder(folder):
+    # Decode a whole folder with VTK's reader and detach the result from the pipeline
+    reader = vtk.vtkDICOMImageReader()
+    reader.SetDirectoryName(folder)
+    reader.Update()
+
+    image = vtk.vtkImageData()
+    image.ShallowCopy(reader.GetOutput())
+    return image
+
+
+def read_folder_volume(folder):
+    """
+    Reads a folder with vtkDICOMImageReader, for series pydicom cannot place or decode.
+
+    Returns:
+        A SeriesVolume with its statistics.
+    """
+    image = read_dicom_folder(folder)
+    array = image_to_array(image)
+    if not array.size:
+        # The VTK reader does not fail on folders without DICOM images, it returns an empty volume
+        raise NoImagesError(f"No DICOM images found in {folder}")
+    return SeriesVolume(array, image.GetSpacing(), image.GetOrigin(), stats=VolumeStats.of(array))
+
+
+def load_volume(folder, fingerprint, files=None, series_uid=None, store=volume_store):
+    """
+    Loads a series from the disk store, or decodes and stores it.
+
+    Args:
+        folder: The series folder, or the label from VolumeCache.key_for_series().
+        fingerprint: Fingerprint of the series' files.
+        files: The series' files when they do not simply fill one folder.
+        series_uid: Series to pick out of files holding several.
+        store: VolumeStore persisting volumes across sessions, or None.
+    """
+    # A volume assembled in an earlier session maps straight back from the disk store
+    volume = None
+    if store is not None:
+        with span("load.store"):
+            volume = store.load(folder, fingerprint)
+    if volume is not None:
+        if volume.stats is None:
+            # Entries stored before statistics were kept get them in one pass over the mapped voxels
+            volume.stats = VolumeStats.of(volume.array)
+        return to_vtk_image(volume)
+
+    # Parallel pydicom loader first; VTK's reader handles anything pydicom cannot place
+    with span("load.decode", folder=folder):
+        try:
+            volume = load_series(folder if files is None else None, files, series_uid)
+        except SeriesLoadError:
+            if files is not None:
+                raise
+            volume = read_folder_volume(folder)
+    if store is not None:
+        with span("load.save"):
+            try:
+                store.save(folder, fingerprint, volume)
+            except OSError:
+                # A full or unwritable cache disk only costs the next open a decode
+                pass
+    return to_vtk_image(volume)
+
+
+def image_nbytes(image):
+    # GetActualMemorySize() reports kibibytes
+    return image.GetActualMemorySize() * 1024
+
+
+class VolumeCache:
+    """
+    Process-wide cache of decoded series shared by every Visualizer, MPR view and filter.
+
+    Entries are keyed by folder path plus a fingerprint of the files inside it, so a
+    series is parsed once per session and re-read only when its files change. The least
+    recently used volumes are evicted once the memory budget is exceeded, or when the
+    global memory manager needs the room.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_MB * 1024 * 1024, loader=load_volume):
+        self.budget_bytes = budget_bytes
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def key_for(self, folder):
+        folder = os.path.abspath(folder)
+        return folder, fingerprint(list_series_files(folder))
+
+    def key_for_series(self, series_uid, files):
+        # Series opened from the study index may share folders with others, so they are keyed by UID
+        return f"series:{series_uid}", fingerprint(files)
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def lookup(self, key):
+        """
+        Returns the cached vtkImageData for a key, or None, counting the hit or miss.
+        """
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        memory_manager.touch("volumes", key)
+        return image
+
+    def get(self, folder):
+        """
+        Returns the vtkImageData for a folder, decoding it on a miss.
+        """
+        return self.fetch(self.key_for(folder))
+
+    def fetch(self, key, **source):
+        """
+        Returns the vtkImageData for a key from key_for() or key_for_series(), decoding it on a miss.
+
+        Args:
+            key: The cache key.
+            source: files= and series_uid= for keys from key_for_series(), passed to the loader.
+        """
+        image = self.lookup(key)
+        if image is None:
+            image = self.loader(*key, **source)
+            self.put(key, image)
+        return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            evicted = self._evict()
+        self._release(evicted)
+        memory_manager.track("volumes", key, image, "volume", evict=self.discard)
+
+    def discard(self, key):
+        # Eviction by the memory manager, which has already forgotten the entry
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.evictions += 1
+
+    def set_budget(self, budget_bytes):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            evicted = self._evict()
+        self._release(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        memory_manager.release_owner("volumes")
+
+    def nbytes(self):
+        with self._lock:
+            return sum(image_nbytes(image) for image in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.nbytes(),
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def _evict(self):
+        # Always keep the most recently used volume, even if it alone exceeds the budget
+        evicted = []
+        while len(self._entries) > 1 and self.nbytes() > self.budget_bytes:
+            evicted.append(self._entries.popitem(last=False)[0])
+            self.evictions += 1
+        return evicted
+
+    def _release(self, keys):
+        # Reported outside the cache lock, so the manager never waits on it
+        for key in keys:
+            memory_manager.release("volumes", key)
+
+
+# Shared instance used across the application
+volume_cache = VolumeCache()
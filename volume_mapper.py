@@ -0,0 +1,59 @@
+import os
+
+import vtk
+
+
+# "gpu" asks vtkSmartVolumeMapper for GPU ray casting; "cpu" uses the multithreaded fixed-point ray caster
+DEFAULT_RENDER_MODE = os.environ.get("DICOM_VIEWER_RENDER_MODE", "gpu").lower()
+
+# Ray casting threads for the CPU mode; 0 uses every core
+DEFAULT_RENDER_THREADS = int(os.environ.get("DICOM_VIEWER_RENDER_THREADS", "0"))
+
+# Frame rate the CPU ray caster aims for while the camera moves, by casting fewer rays
+DEFAULT_INTERACTIVE_FPS = float(os.environ.get("DICOM_VIEWER_INTERACTIVE_FPS", "15"))
+
+# Coarsest image sample distance (pixels per ray) allowed while the camera moves
+MAX_INTERACTIVE_IMAGE_SAMPLE_DISTANCE = 4.0
+
+
+def make_volume_mapper(image_data, mode=DEFAULT_RENDER_MODE, threads=DEFAULT_RENDER_THREADS):
+    """
+    Builds the ray casting mapper of a render mode.
+
+    Args:
+        image_data: The volume to ray cast.
+        mode: "gpu" or "cpu".
+        threads: Ray casting threads for the CPU mode; 0 uses every core.
+    """
+    if mode == "cpu":
+        mapper = vtk.vtkFixedPointVolumeRayCastMapper()
+        mapper.SetNumberOfThreads(threads or os.cpu_count() or 1)
+        mapper.SetMinimumImageSampleDistance(1.0)
+        mapper.SetMaximumImageSampleDistance(MAX_INTERACTIVE_IMAGE_SAMPLE_DISTANCE)
+        set_interactive_quality(mapper, False)
+    elif mode == "gpu":
+        mapper = vtk.vtkSmartVolumeMapper()
+        mapper.SetRequestedRenderModeToGPU()
+    else:
+        raise ValueError(f"Unknown render mode {mode!r}")
+    mapper.SetBlendModeToComposite()
+    mapper.SetInputData(image_data)
+    return mapper
+
+
+def set_interactive_quality(mapper, interactive):
+    """
+    Switches a CPU ray caster between its interactive and still quality.
+
+    While the camera moves, the mapper picks its image and ray sample distances every
+    frame so it meets the render window's desired update rate (the interactor's
+    DesiredUpdateRate during interaction). Once the camera stops, every pixel gets its
+    own ray at the full sampling rate. GPU mappers are left alone.
+    """
+    if not isinstance(mapper, vtk.vtkFixedPointVolumeRayCastMapper):
+        return
+    if interactive:
+        mapper.AutoAdjustSampleDistancesOn()
+    else:
+        mapper.AutoAdjustSampleDistancesOff()
+        mapper.SetImageSampleDistance(1.0)
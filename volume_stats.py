@@ -0,0 +1,186 @@
+import numpy as np
+from vtk.util import numpy_support
+
+
+# Histogram bins are one unit wide over the int16 range, which holds every CT value in HU;
+# uint16 volumes shift them to start at 0
+HISTOGRAM_MIN = -32768
+HISTOGRAM_BINS = 65536
+
+# Field data arrays carrying the statistics on a vtkImageData
+HISTOGRAM_ARRAY = "VolumeHistogram"
+HISTOGRAM_START_ARRAY = "VolumeHistogramStart"
+
+
+class VolumeStats:
+    """
+    Value histogram of a volume, accumulated one slice at a time as it is decoded.
+
+    Bins are one value wide (float volumes are floored), so min, max, mean and
+    percentiles all come from the histogram without touching the voxels again. The
+    bins cover the int16 range by default; for_dtype() shifts them to 0..65535 for
+    uint16 volumes.
+
+    Args:
+        counts: Voxel count per bin, starting at value start.
+        start: Value of the first bin.
+    """
+
+    def __init__(self, counts=None, start=HISTOGRAM_MIN):
+        self.counts = np.zeros(HISTOGRAM_BINS, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.start = int(start)
+
+    def add(self, values):
+        """
+        Counts the voxels of one slice (or any array) into the histogram.
+        """
+        values = np.asarray(values).reshape(-1)
+        if values.dtype.kind == "f":
+            values = np.floor(values)
+        if not self.holds(values.dtype):
+            values = np.clip(values, self.start, self.start + len(self.counts) - 1)
+        # Offsetting in int32 keeps bincount's input non-negative without promoting to float
+        self.counts += np.bincount(values.astype(np.int32) - self.start, minlength=len(self.counts))[:len(self.counts)]
+
+    def holds(self, dtype):
+        # Whether every value of an integer dtype has its own bin, so nothing needs clipping
+        if dtype.kind not in "iu" or dtype.itemsize > 2:
+            return False
+        info = np.iinfo(dtype)
+        return info.min >= self.start and info.max < self.start + len(self.counts)
+
+    @classmethod
+    def for_dtype(cls, dtype):
+        """
+        Empty statistics whose bins cover every value of a 16-bit dtype.
+        """
+        return cls(start=0 if np.dtype(dtype) == np.uint16 else HISTOGRAM_MIN)
+
+    @classmethod
+    def of(cls, array):
+        """
+        Statistics of a whole (z, y, x) array, accumulated slice by slice.
+        """
+        stats = cls.for_dtype(array.dtype)
+        for plane in array:
+            stats.add(plane)
+        return stats.trimmed()
+
+    def trimmed(self):
+        # The same histogram without its empty tails, small enough for a store header
+        nonzero = np.flatnonzero(self.counts)
+        if not len(nonzero):
+            return VolumeStats(np.zeros(1, dtype=np.int64), 0)
+        return VolumeStats(self.counts[nonzero[0]:nonzero[-1] + 1].copy(), self.start + int(nonzero[0]))
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def min(self):
+        nonzero = np.flatnonzero(self.counts)
+        return self.start + int(nonzero[0]) if len(nonzero) else 0
+
+    @property
+    def max(self):
+        nonzero = np.flatnonzero(self.counts)
+        return self.start + int(nonzero[-1]) if len(nonzero) else 0
+
+    @property
+    def mean(self):
+        count = self.count
+        if not count:
+            return 0.0
+        return float(np.dot(self.counts, np.arange(len(self.counts), dtype=np.float64)) / count + self.start)
+
+    def percentile(self, *percents):
+        """
+        Values below which the given percentages of voxels fall, one per percent.
+        """
+        cumulative = np.cumsum(self.counts)
+        if not len(cumulative) or not cumulative[-1]:
+            return [0] * len(percents)
+        ranks = np.asarray(percents, dtype=np.float64) / 100.0 * cumulative[-1]
+        indices = np.searchsorted(cumulative, np.maximum(ranks, 1), side="left")
+        return [self.start + int(i) for i in np.minimum(indices, len(cumulative) - 1)]
+
+    def auto_window_level(self, low=1.0, high=99.0):
+        """
+        Window and level covering the low..high percentile range of the voxels.
+        """
+        bottom, top = self.percentile(low, high)
+        return max(top - bottom, 1), (top + bottom) / 2.0
+
+    def is_hounsfield(self):
+        # CT volumes in HU hold air at about -1000; other modalities never go that negative
+        return self.min <= -900
+
+    def to_dict(self):
+        trimmed = self.trimmed()
+        return {"start": trimmed.start, "counts": trimmed.counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["counts"], data["start"])
+
+
+# Two-band CT preset in HU: lung parenchyma, then soft tissue fading out before a thin bone shell
+CT_OPACITY_POINTS = (
+    (-800.0, 0.0), (-750.0, 1.0), (-350.0, 1.0), (-300.0, 0.0), (-200.0, 0.0),
+    (-100.0, 1.0), (1000.0, 0.0), (2750.0, 0.0), (2976.0, 1.0), (3000.0, 0.0),
+)
+
+
+def opacity_points(stats):
+    """
+    Scalar opacity transfer function points for a volume.
+
+    CT in HU (or a volume without statistics) gets the CT preset. Anything else is
+    seeded from its histogram: the background below the median stays transparent and
+    opacity ramps up through the upper percentiles to the maximum.
+
+    Returns:
+        A list of (value, opacity) pairs in increasing value order.
+    """
+    if stats is None or stats.is_hounsfield():
+        return list(CT_OPACITY_POINTS)
+    p50, p90, p99 = stats.percentile(50, 90, 99)
+    points = [(stats.min, 0.0), (p50, 0.0), (p90, 0.15), (p99, 0.6), (stats.max, 1.0)]
+    seeded = []
+    for value, opacity in points:
+        if not seeded or value > seeded[-1][0]:
+            seeded.append((float(value), opacity))
+    return seeded
+
+
+def attach_stats(image, stats):
+    """
+    Stores statistics in a vtkImageData's field data, so they travel with the volume
+    through the caches and shallow copies.
+    """
+    trimmed = stats.trimmed()
+    field_data = image.GetFieldData()
+    counts = numpy_support.numpy_to_vtk(trimmed.counts, deep=True, array_type=numpy_support.get_vtk_array_type(np.int64))
+    counts.SetName(HISTOGRAM_ARRAY)
+    start = numpy_support.numpy_to_vtk(np.array([trimmed.start], dtype=np.int64), deep=True,
+                                       array_type=numpy_support.get_vtk_array_type(np.int64))
+    start.SetName(HISTOGRAM_START_ARRAY)
+    field_data.RemoveArray(HISTOGRAM_ARRAY)
+    field_data.RemoveArray(HISTOGRAM_START_ARRAY)
+    field_data.AddArray(counts)
+    field_data.AddArray(start)
+
+
+def stats_of(image):
+    """
+    The statistics attached to a vtkImageData by attach_stats(), or None.
+    """
+    if image is None:
+        return None
+    field_data = image.GetFieldData()
+    counts = field_data.GetArray(HISTOGRAM_ARRAY)
+    start = field_data.GetArray(HISTOGRAM_START_ARRAY)
+    if counts is None or start is None:
+        return None
+    return VolumeStats(numpy_support.vtk_to_numpy(counts), int(start.GetValue(0)))
@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+import numpy as np
+
+from disk_store import DEFAULT_CACHE_DIR, DiskStore
+from series_loader import SeriesVolume
+from volume_stats import VolumeStats
+
+
+DEFAULT_STORE_MB = int(os.environ.get("DICOM_VIEWER_DISK_CACHE_MB", "20480"))
+
+
+def source_label(folder):
+    # Folders are stored as absolute paths; "series:<uid>" labels of indexed series are not paths
+    return folder if folder.startswith("series:") else os.path.abspath(folder)
+
+
+class VolumeStore(DiskStore):
+    """
+    Persistent on-disk cache of assembled volumes.
+
+    Each entry is a raw .npy voxel array plus a small JSON header (spacing, origin,
+    direction, series UID, value histogram and the source-file fingerprint). Reopening a series maps the
+    array back zero-copy instead of parsing DICOM. Entries are keyed by folder and
+    fingerprint, so edited source files simply miss; the oldest entries are evicted once
+    the directory grows past its size cap.
+    """
+
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, "volumes"), budget_bytes=DEFAULT_STORE_MB * 1024 * 1024):
+        super().__init__(root, budget_bytes)
+
+    def _paths(self, base):
+        return {"data": base + ".npy"}, base + ".json"
+
+    def _entry(self, folder, fingerprint):
+        name = hashlib.sha1(f"{source_label(folder)}\0{fingerprint}".encode()).hexdigest()
+        array_paths, header_path = self._paths(os.path.join(self.root, name))
+        return array_paths["data"], header_path
+
+    def contains(self, folder, fingerprint):
+        data_path, header_path = self._entry(folder, fingerprint)
+        return os.path.exists(data_path) and os.path.exists(header_path)
+
+    def load(self, folder, fingerprint):
+        """
+        Maps a stored volume back into memory.
+
+        Returns:
+            A SeriesVolume whose array is a copy-on-write memory map, or None on a miss.
+        """
+        data_path, header_path = self._entry(folder, fingerprint)
+        header = self._read_header(header_path)
+        try:
+            if header is None or header["fingerprint"] != fingerprint:
+                return None
+            array = np.load(data_path, mmap_mode="c")
+        except (OSError, ValueError, KeyError):
+            return None
+
+        self._touch(header_path)
+        stats = VolumeStats.from_dict(header["stats"]) if header.get("stats") else None
+        return SeriesVolume(
+            array, header["spacing"], header["origin"], header["direction"], header["series_uid"], stats
+        )
+
+    def save(self, folder, fingerprint, volume):
+        data_path, header_path = self._entry(folder, fingerprint)
+        header = {
+            "folder": source_label(folder),
+            "fingerprint": fingerprint,
+            "series_uid": volume.series_uid,
+            "shape": list(volume.array.shape),
+            "dtype": volume.array.dtype.str,
+            "spacing": list(volume.spacing),
+            "origin": list(volume.origin),
+            "direction": list(volume.direction),
+            "stats": volume.stats.to_dict() if volume.stats is not None else None,
+        }
+
+        self._write(header_path[: -len(".json")], {"data": np.asarray(volume.array)}, header)
+
+    def _is_stale(self, header, other):
+        # Older fingerprints of the same folder can never be hit again
+        return other.get("folder") == header["folder"]
+
+
+# Shared instance used across the application
+volume_store = VolumeStore()